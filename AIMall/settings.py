@@ -109,6 +109,10 @@ REST_FRAMEWORK = {
         'rest_framework.parsers.MultiPartParser',
         'rest_framework.parsers.FormParser',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -174,14 +178,42 @@ WSGI_APPLICATION = 'AIMall.wsgi.application'
 
 
 # Database configuration for Render
+# Connections are kept open between requests (CONN_MAX_AGE) so the many
+# short AllowAny endpoints don't pay TCP/auth setup on every hit.
 DATABASES = {
     'default': dj_database_url.config(
         default='sqlite:///' + str(BASE_DIR / 'db.sqlite3'),
-        conn_max_age=600,
+        conn_max_age=config('DB_CONN_MAX_AGE', default=600, cast=int),
         conn_health_checks=True,
     )
 }
 
+# When Postgres is fronted by PgBouncer in transaction pooling mode,
+# server-side cursors must be disabled (they don't survive across transactions)
+if config('DB_USE_PGBOUNCER', default=False, cast=bool):
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+# Cache configuration - Redis when REDIS_URL is set, otherwise a database
+# table (created by `python manage.py createcachetable`). Either way the cache
+# is shared by every worker: login OTPs, Idempotency-Key replays and cache
+# invalidation all depend on that, so never fall back to a per-process cache.
+REDIS_URL = config('REDIS_URL', default='')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
+
 
 # Replace your current DATABASES section with this:
 # DATABASES = {
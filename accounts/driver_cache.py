@@ -0,0 +1,17 @@
+# accounts/driver_cache.py
+"""
+Short-lived cache for the driver details payload served to the driver app.
+
+Entries are keyed by the driver's user id and dropped whenever the driver or
+its user row changes.
+"""
+from django.core.cache import cache
+
+
+DRIVER_DETAILS_CACHE_KEY = 'driver_details:{}'
+DRIVER_DETAILS_CACHE_TTL = 300
+
+
+def invalidate_driver_details(*user_ids):
+    """Drop cached details for the given driver user ids"""
+    cache.delete_many([DRIVER_DETAILS_CACHE_KEY.format(user_id) for user_id in user_ids])
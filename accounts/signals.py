@@ -0,0 +1,19 @@
+# accounts/signals.py
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .driver_cache import invalidate_driver_details
+from .models import Driver, User
+
+
+@receiver([post_save, post_delete], sender=Driver)
+def invalidate_driver_details_for_driver(sender, instance, **kwargs):
+    """Expire the cached driver details when the profile changes"""
+    invalidate_driver_details(instance.user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_driver_details_for_user(sender, instance, **kwargs):
+    """Phone and email in the driver details come from the user row"""
+    if instance.user_type == 'driver':
+        invalidate_driver_details(instance.pk)
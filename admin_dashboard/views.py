@@ -11,7 +11,9 @@ from django.http import JsonResponse
 from django.core.paginator import Paginator
 
 from accounts.models import SecurityQuestion, User, Customer, UserSecurityAnswer, Vendor, Driver, AdminProfile
+from accounts.driver_cache import invalidate_driver_details
 from location.models import DeliveryZone
+from location.zone_cache import bump_zones_version
 from products.models import Category, MeasurementUnitType, ProductAddonMapping, ProductTemplate, ProductVariant, MeasurementUnit, GlobalSetting, UnitPrice
 from markets.models import Market, MarketZone
 from order.models import Order, OrderItem, OrderStatusUpdate
@@ -791,6 +793,9 @@ def bulk_driver_action(request):
         elif action == 'set-unavailable':
             drivers.update(is_available=False)
             messages.success(request, f'{len(drivers)} drivers set as unavailable.')
+        
+        # Queryset updates skip the post_save signals that expire cached details
+        invalidate_driver_details(*user_ids)
     
     return redirect('admin_dashboard:manage-drivers')
 
@@ -1910,9 +1915,11 @@ def bulk_delivery_zone_action(request, market_id):
             
             if action == 'activate':
                 zones.update(is_active=True)
+                bump_zones_version()
                 messages.success(request, f'{zones.count()} delivery zone(s) activated.')
             elif action == 'deactivate':
                 zones.update(is_active=False)
+                bump_zones_version()
                 messages.success(request, f'{zones.count()} delivery zone(s) deactivated.')
             elif action == 'delete':
                 count = zones.count()
@@ -2232,17 +2239,21 @@ def bulk_delivery_zone_action(request, market_id):
         
         if action == 'activate':
             zones.update(is_active=True)
+            bump_zones_version()
             message = f'{zones.count()} zone(s) activated.'
         elif action == 'deactivate':
             zones.update(is_active=False)
+            bump_zones_version()
             message = f'{zones.count()} zone(s) deactivated.'
         elif action == 'make_standard':
             zones.update(zone_type='standard', fixed_price=None, surcharge_percent=None)
+            bump_zones_version()
             message = f'{zones.count()} zone(s) changed to standard pricing.'
         elif action == 'make_fixed':
             # Get default fixed price from request or use 0
             fixed_price = data.get('fixed_price', 0)
             zones.update(zone_type='fixed', fixed_price=fixed_price, surcharge_percent=None)
+            bump_zones_version()
             message = f'{zones.count()} zone(s) changed to fixed pricing.'
         elif action == 'delete':
             count = zones.count()
@@ -2266,16 +2277,20 @@ def bulk_delivery_zone_action(request, market_id):
         
         if action == 'activate':
             zones.update(is_active=True)
+            bump_zones_version()
             messages.success(request, f'{zones.count()} zone(s) activated.')
         elif action == 'deactivate':
             zones.update(is_active=False)
+            bump_zones_version()
             messages.success(request, f'{zones.count()} zone(s) deactivated.')
         elif action == 'make_standard':
             zones.update(zone_type='standard', fixed_price=None, surcharge_percent=None)
+            bump_zones_version()
             messages.success(request, f'{zones.count()} zone(s) changed to standard pricing.')
         elif action == 'make_fixed':
             fixed_price = request.POST.get('fixed_price', 0)
             zones.update(zone_type='fixed', fixed_price=fixed_price, surcharge_percent=None)
+            bump_zones_version()
             messages.success(request, f'{zones.count()} zone(s) changed to fixed pricing.')
         elif action == 'delete':
             count = zones.count()
@@ -2371,21 +2386,25 @@ def bulk_update_delivery_zones(request, market_id):
             if action == 'update_priority':
                 new_priority = request.POST.get('priority', 1)
                 zones.update(priority=new_priority)
+                bump_zones_version()
                 messages.success(request, f'Priority updated for {zones.count()} zone(s).')
                 
             elif action == 'update_fixed_price':
                 fixed_price = request.POST.get('fixed_price', 0)
                 zones.filter(zone_type='fixed').update(fixed_price=fixed_price)
+                bump_zones_version()
                 messages.success(request, f'Fixed price updated for {zones.filter(zone_type="fixed").count()} zone(s).')
                 
             elif action == 'update_surcharge':
                 surcharge_percent = request.POST.get('surcharge_percent', 0)
                 zones.filter(zone_type='surcharge').update(surcharge_percent=surcharge_percent)
+                bump_zones_version()
                 messages.success(request, f'Surcharge updated for {zones.filter(zone_type="surcharge").count()} zone(s).')
                 
             elif action == 'update_base_fee':
                 base_fee = request.POST.get('base_fee', 0)
                 zones.filter(zone_type='standard').update(base_fee=base_fee)
+                bump_zones_version()
                 messages.success(request, f'Base fee updated for {zones.filter(zone_type="standard").count()} zone(s).')
                 
             else:
@@ -11,6 +11,7 @@ This module provides helper functions for driver order delivery system:
 """
 
 from decimal import Decimal
+from django.core.cache import cache
 from django.utils import timezone
 from geopy.distance import geodesic
 from order.models import Order, OrderItem
@@ -19,6 +20,11 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Latest driver position per order; pings arrive every 2 minutes, so an
+# entry outlives one missed ping before the driver is considered gone
+ORDER_DRIVER_LOCATION_CACHE_KEY = 'order_driver_location:{}'
+ORDER_DRIVER_LOCATION_TTL = 300
+
 
 # ============================================
 # 1. LOCATION HELPERS
@@ -44,8 +50,10 @@ def get_market_location(order):
     - Fetch vendor's associated market
     - Return market coordinates and name
     - Fallback to default if no market found
+    - Reads order.items.all() so an items prefetch is reused
     """
-    if not order.items.exists():
+    items = order.items.all()
+    if not items:
         return {
             'name': 'Market',
             'latitude': -6.8,
@@ -54,7 +62,7 @@ def get_market_location(order):
         }
     
     try:
-        first_item = order.items.first()
+        first_item = items[0]
         variant = first_item.product_variant
         vendor = variant.vendor
         
@@ -167,14 +175,18 @@ def get_valid_items(order):
         order (Order): The order instance
     
     Returns:
-        QuerySet: OrderItems with quantity > 0
+        list: OrderItems with quantity > 0
     
     Logic:
     - Filter items by quantity > 0
     - Exclude items with zero or negative quantities
     - Ordered by creation date
+    - Filtered in Python over order.items.all() so an items prefetch is reused
     """
-    return order.items.filter(quantity__gt=0).order_by('created_at')
+    return sorted(
+        (item for item in order.items.all() if item.quantity > 0),
+        key=lambda item: item.created_at
+    )
 
 
 def format_order_item_for_display(item):
@@ -238,12 +250,13 @@ def format_order_item_for_display(item):
 # 3. ORDER TOTALS CALCULATION
 # ============================================
 
-def calculate_items_total_only(order):
+def calculate_items_total_only(order, valid_items=None):
     """
     Calculate total from ONLY items (no fees)
     
     Args:
         order (Order): The order instance
+        valid_items (list): Result of get_valid_items(order), if already known
     
     Returns:
         Decimal: Sum of all valid items' total_price
@@ -254,7 +267,8 @@ def calculate_items_total_only(order):
     - Do NOT include delivery_fee, service_fee, discount
     - This is what driver sees and customer paid for items
     """
-    valid_items = get_valid_items(order)
+    if valid_items is None:
+        valid_items = get_valid_items(order)
     items_total = sum(
         Decimal(str(item.total_price)) for item in valid_items
     ) or Decimal('0.00')
@@ -325,7 +339,7 @@ def get_order_summary_for_driver(order):
         },
         'items': [format_order_item_for_display(item) for item in valid_items],
         'items_total': float(items_total),
-        'items_count': valid_items.count(),
+        'items_count': len(valid_items),
         'payment_method': order.get_payment_method_display() if hasattr(order, 'get_payment_method_display') else order.payment_method,
         'is_paid': order.is_paid,
         'status': order.status,
@@ -351,29 +365,48 @@ def record_driver_location(order, driver_latitude, driver_longitude):
         dict: Status and saved location
     
     Logic:
-    - Store driver location in a tracking model (if created)
-    - Or update a field on the order/driver
+    - Store the latest location in the shared cache, keyed by order
+    - Nothing is written to the database on this hot path
     - Called every 2 minutes from driver app
     - Used to show customer driver's real-time location
     """
     try:
-        # For now, log the location
-        # In future: Create DriverLocationTracking model
-        logger.info(
-            f"Driver location: Order {order.order_number}, "
-            f"Lat: {driver_latitude}, Lon: {driver_longitude}"
+        timestamp = timezone.now().isoformat()
+        cache.set(
+            ORDER_DRIVER_LOCATION_CACHE_KEY.format(order.id),
+            {
+                'latitude': float(driver_latitude),
+                'longitude': float(driver_longitude),
+                'timestamp': timestamp
+            },
+            timeout=ORDER_DRIVER_LOCATION_TTL
+        )
+        logger.debug(
+            'Driver location: Order %s, Lat: %s, Lon: %s',
+            order.order_number, driver_latitude, driver_longitude
         )
         
         return {
             'status': 'recorded',
             'order_id': str(order.id),
-            'timestamp': timezone.now().isoformat()
+            'timestamp': timestamp
         }
     except Exception as e:
         logger.error(f"Error recording driver location: {e}")
         return {'status': 'error', 'message': str(e)}
 
 
+def get_driver_location(order):
+    """
+    Latest location recorded by record_driver_location for an order
+    
+    Returns:
+        dict: latitude, longitude and timestamp, or None when the driver
+        has not pinged within ORDER_DRIVER_LOCATION_TTL
+    """
+    return cache.get(ORDER_DRIVER_LOCATION_CACHE_KEY.format(order.id))
+
+
 # ============================================
 # 5. VALIDATION HELPERS
 # ============================================
@@ -397,7 +430,7 @@ def validate_order_for_driver_pickup(order):
     errors = []
     
     # Check items
-    if not get_valid_items(order).exists():
+    if not get_valid_items(order):
         errors.append("Order has no valid items")
     
     # Check locations
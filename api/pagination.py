@@ -0,0 +1,35 @@
+# api/pagination.py
+from rest_framework.pagination import CursorPagination
+
+
+class OptionalCursorPagination(CursorPagination):
+    """
+    Cursor pagination that only applies when the client asks for it with
+    ?cursor= or ?page_size=, so existing clients keep getting plain lists.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('name', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class OptionalOrderCursorPagination(OptionalCursorPagination):
+    """
+    Opt-in cursor pagination for order feeds that keeps the ordering the
+    view already applied, unless it leads with a nullable column: a NULL
+    cursor position cannot be compared, so those pages use created_at.
+    """
+    page_size = 20
+    ordering = ('-created_at', 'id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = queryset.query.order_by
+        if ordering and not queryset.model._meta.get_field(ordering[0].lstrip('-')).null:
+            return tuple(ordering) + ('id',)
+        return super().get_ordering(request, queryset, view)
@@ -20,6 +20,13 @@ from products.models import (
 from markets.models import Market, MarketZone
 from location.models import CustomerAddress, DeliveryZone, DeliveryFeeConfig
 from order.models import Order, OrderItem, Cart, CartItem
+from .driver_order_helpers import (
+    get_market_location,
+    get_delivery_location,
+    calculate_distance_between_points,
+    get_valid_items,
+    calculate_items_total_only,
+)
 
 
 # ============================================
@@ -262,7 +269,12 @@ class ProductVariantDetailSerializer(serializers.ModelSerializer):
         )
     
     def get_available_addons(self, obj):
-        mappings = ProductAddonMapping.objects.filter(product_variant=obj, is_active=True)
+        # Use the view's prefetch when present
+        mappings = getattr(obj, 'active_addon_mappings', None)
+        if mappings is None:
+            mappings = ProductAddonMapping.objects.filter(
+                product_variant=obj, is_active=True
+            ).select_related('addon')
         return ProductAddonSerializer([m.addon for m in mappings], many=True).data
     
     def get_product_image(self, obj):
@@ -297,6 +309,12 @@ class ProductTemplateListSerializer(serializers.ModelSerializer):
     def get_vendors_count(self, obj):
         return obj.variants.filter(is_active=True).count()
     
+    def _approved_variants(self, obj):
+        """Active, approved variants; uses the view's prefetch when present"""
+        if hasattr(obj, 'approved_variants'):
+            return obj.approved_variants
+        return obj.variants.filter(is_active=True, is_approved=True)
+    
     def get_available_units(self, obj):
         """Return list of available units for this product with their symbols"""
         units = obj.available_units.filter(is_active=True).order_by('sort_order')
@@ -316,14 +334,10 @@ class ProductTemplateListSerializer(serializers.ModelSerializer):
         Strategy: find the largest `selling_price` among all variants' unit_prices
         (so customers see the highest price option in the listing). Return as string.
         """
-        from decimal import Decimal
         max_price = None
-        for variant in obj.variants.filter(is_active=True, is_approved=True):
+        for variant in self._approved_variants(obj):
             for up in variant.unit_prices.all():
-                try:
-                    val = Decimal(str(up.selling_price))
-                except Exception:
-                    continue
+                val = up.selling_price
                 if max_price is None or val > max_price:
                     max_price = val
 
@@ -334,15 +348,11 @@ class ProductTemplateListSerializer(serializers.ModelSerializer):
         Return the unit symbol associated with the display price (if available).
         If multiple units tie, prefer the first encountered.
         """
-        from decimal import Decimal
         max_price = None
         unit_symbol = None
-        for variant in obj.variants.filter(is_active=True, is_approved=True):
+        for variant in self._approved_variants(obj):
             for up in variant.unit_prices.all():
-                try:
-                    val = Decimal(str(up.selling_price))
-                except Exception:
-                    continue
+                val = up.selling_price
                 if max_price is None or val > max_price:
                     max_price = val
                     unit_symbol = getattr(up, 'unit_symbol', None) or getattr(getattr(up, 'unit', None), 'symbol', None)
@@ -357,17 +367,13 @@ class ProductTemplateListSerializer(serializers.ModelSerializer):
         variants. The returned dict includes variant id, vendor info and the
         selected unit_price data.
         """
-        from decimal import Decimal
         primary = None
         primary_up = None
 
-        for variant in obj.variants.filter(is_active=True, is_approved=True):
+        for variant in self._approved_variants(obj):
             for up in variant.unit_prices.all():
-                try:
-                    val = Decimal(str(up.selling_price))
-                except Exception:
-                    continue
-                if primary_up is None or val > Decimal(str(primary_up.selling_price)):
+                val = up.selling_price
+                if primary_up is None or val > primary_up.selling_price:
                     primary = variant
                     primary_up = up
 
@@ -394,7 +400,7 @@ class ProductTemplateListSerializer(serializers.ModelSerializer):
                     'selling_price': str(up.selling_price),
                     'cost_price': str(up.cost_price) if getattr(up, 'cost_price', None) is not None else None,
                 }
-                for up in primary.unit_prices.filter(is_active=True)
+                for up in primary.unit_prices.all() if up.is_active
             ]
         }
 
@@ -424,6 +430,10 @@ class ProductTemplateDetailSerializer(serializers.ModelSerializer):
     
     def get_variants(self, obj):
         """Return variants, optionally filtered by market"""
+        # The retrieve view prefetches exactly the variants to consider
+        if hasattr(obj, 'filtered_variants'):
+            return self._primary_variant_data(obj.filtered_variants)
+        
         variants = obj.variants.filter(is_active=True, is_approved=True)
         
         # Check if we should filter by market
@@ -442,18 +452,17 @@ class ProductTemplateDetailSerializer(serializers.ModelSerializer):
                 # If market is invalid, return empty variants
                 variants = variants.none()
         
+        return self._primary_variant_data(variants)
+    
+    def _primary_variant_data(self, variants):
         # Choose the single primary variant (highest unit_price selling_price)
-        from decimal import Decimal
         primary_variant = None
         primary_up = None
 
         for variant in variants:
             for up in variant.unit_prices.all():
-                try:
-                    val = Decimal(str(up.selling_price))
-                except Exception:
-                    continue
-                if primary_up is None or val > Decimal(str(primary_up.selling_price)):
+                val = up.selling_price
+                if primary_up is None or val > primary_up.selling_price:
                     primary_variant = variant
                     primary_up = up
 
@@ -630,6 +639,31 @@ class CustomerAddressCreateSerializer(serializers.ModelSerializer):
         return v
 
 
+# ============================================
+# DELIVERY FEE SERIALIZERS
+# ============================================
+
+class DeliveryLocationSerializer(serializers.Serializer):
+    """Customer location (and optional order total) for delivery fee lookups"""
+    latitude = serializers.FloatField(min_value=-90, max_value=90)
+    longitude = serializers.FloatField(min_value=-180, max_value=180)
+    order_total = serializers.FloatField(required=False, default=0)
+
+
+class DeliveryFeeContextSerializer(DeliveryLocationSerializer):
+    """Market, customer location and order total for fee calculation with context"""
+    market_id = serializers.UUIDField()
+    order_total = serializers.FloatField()
+
+
+class DeliveryFeeCalculateSerializer(serializers.Serializer):
+    """Market and customer location for the basic delivery fee calculation"""
+    market_id = serializers.UUIDField()
+    customer_latitude = serializers.FloatField(min_value=-90, max_value=90)
+    customer_longitude = serializers.FloatField(min_value=-180, max_value=180)
+    order_total = serializers.FloatField(required=False, default=0)
+
+
 # ============================================
 # ORDER SERIALIZERS
 # ============================================
@@ -765,6 +799,9 @@ class OrderListSerializer(serializers.ModelSerializer):
         )
     
     def get_order_items_count(self, obj):
+        # Annotated by OrderViewSet.list
+        if hasattr(obj, 'items_count'):
+            return obj.items_count
         return obj.items.count()
 
 
@@ -812,7 +849,28 @@ class AdminOrderListSerializer(serializers.ModelSerializer):
 # DRIVER SERIALIZERS
 # ============================================
 
-class DriverOrderListSerializer(serializers.ModelSerializer):
+class DriverOrderMemoMixin:
+    """
+    Per-order memo for helper results that several driver fields share:
+    the market location feeds market_location and distance_km, the valid
+    items feed items, items_count and items_total.
+    """
+    
+    def _memo(self, obj, name, compute):
+        memo = self.__dict__.setdefault('_order_memo', {})
+        key = (obj.pk, name)
+        if key not in memo:
+            memo[key] = compute(obj)
+        return memo[key]
+    
+    def _market_location(self, obj):
+        return self._memo(obj, 'market_location', get_market_location)
+    
+    def _valid_items(self, obj):
+        return self._memo(obj, 'valid_items', get_valid_items)
+
+
+class DriverOrderListSerializer(DriverOrderMemoMixin, serializers.ModelSerializer):
     """Order for driver delivery list with sufficient info for cards"""
     customer_name = serializers.CharField(source='customer.customer.names', read_only=True)
     customer_phone = serializers.CharField(source='customer.phone_number', read_only=True)
@@ -843,23 +901,15 @@ class DriverOrderListSerializer(serializers.ModelSerializer):
     
     def get_market_location(self, obj):
         """Get market location for pickup"""
-        from .driver_order_helpers import get_market_location
-        return get_market_location(obj)
+        return self._market_location(obj)
     
     def get_delivery_location(self, obj):
         """Get delivery coordinates"""
-        from .driver_order_helpers import get_delivery_location
         return get_delivery_location(obj)
     
     def get_distance_km(self, obj):
         """Calculate distance between market and delivery point"""
-        from .driver_order_helpers import (
-            get_market_location, 
-            get_delivery_location, 
-            calculate_distance_between_points
-        )
-        
-        market = get_market_location(obj)
+        market = self._market_location(obj)
         delivery = get_delivery_location(obj)
         
         return calculate_distance_between_points(
@@ -871,16 +921,14 @@ class DriverOrderListSerializer(serializers.ModelSerializer):
     
     def get_items_count(self, obj):
         """Count only valid items (quantity > 0)"""
-        from .driver_order_helpers import get_valid_items
-        return get_valid_items(obj).count()
+        return len(self._valid_items(obj))
 
     def get_items_total(self, obj):
         """Sum of all item prices"""
-        from .driver_order_helpers import calculate_items_total_only
-        return float(calculate_items_total_only(obj))
+        return float(calculate_items_total_only(obj, self._valid_items(obj)))
 
 
-class DriverOrderDetailSerializer(serializers.ModelSerializer):
+class DriverOrderDetailSerializer(DriverOrderMemoMixin, serializers.ModelSerializer):
     """
     Detailed order view for driver with complete location and item information
     
@@ -947,8 +995,7 @@ class DriverOrderDetailSerializer(serializers.ModelSerializer):
         Returns:
             dict with name, latitude, longitude, address
         """
-        from .driver_order_helpers import get_market_location
-        return get_market_location(obj)
+        return self._market_location(obj)
     
     def get_delivery_location(self, obj):
         """
@@ -957,7 +1004,6 @@ class DriverOrderDetailSerializer(serializers.ModelSerializer):
         Returns:
             dict with latitude, longitude, address, location_name
         """
-        from .driver_order_helpers import get_delivery_location
         return get_delivery_location(obj)
     
     def get_distance_km(self, obj):
@@ -973,13 +1019,7 @@ class DriverOrderDetailSerializer(serializers.ModelSerializer):
         Returns:
             float: Distance in kilometers
         """
-        from .driver_order_helpers import (
-            get_market_location, 
-            get_delivery_location, 
-            calculate_distance_between_points
-        )
-        
-        market = get_market_location(obj)
+        market = self._market_location(obj)
         delivery = get_delivery_location(obj)
         
         return calculate_distance_between_points(
@@ -1003,9 +1043,7 @@ class DriverOrderDetailSerializer(serializers.ModelSerializer):
         Returns:
             list of formatted order items with all display information
         """
-        from .driver_order_helpers import get_valid_items
-        
-        valid_items = get_valid_items(obj)
+        valid_items = self._valid_items(obj)
         
         items_data = []
         for item in valid_items:
@@ -1051,13 +1089,11 @@ class DriverOrderDetailSerializer(serializers.ModelSerializer):
         Returns:
             float: Sum of all item prices
         """
-        from .driver_order_helpers import calculate_items_total_only
-        return float(calculate_items_total_only(obj))
+        return float(calculate_items_total_only(obj, self._valid_items(obj)))
     
     def get_items_count(self, obj):
         """Count of valid items in order"""
-        from .driver_order_helpers import get_valid_items
-        return get_valid_items(obj).count()
+        return len(self._valid_items(obj))
 
 
 class FavoriteItemSerializer(serializers.ModelSerializer):
@@ -9,10 +9,16 @@ Test coverage:
 - Driver order handling
 """
 
-from django.test import TestCase
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from urllib.parse import parse_qs, urlparse
+
+from django.test import SimpleTestCase, TestCase
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from decimal import Decimal
 from django.utils import timezone
 
@@ -24,6 +30,8 @@ from products.models import (
 from markets.models import Market, MarketZone
 from location.models import CustomerAddress, DeliveryZone, DeliveryFeeConfig
 from order.models import Order, OrderItem, Cart, CartItem
+from .renderers import ORJSONRenderer
+from .views import DRIVER_OTP_CACHE_KEY, DRIVER_OTP_ATTEMPTS_CACHE_KEY
 
 User = get_user_model()
 
@@ -138,6 +146,32 @@ class CustomerAuthTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
 
+class DriverAuthTestCase(TestCase):
+    """Test driver OTP verification"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.phone_number = '+255712345690'
+        cache.set_many({
+            DRIVER_OTP_CACHE_KEY.format(self.phone_number): {'otp': '123456', 'email': 'driver@example.com'},
+            DRIVER_OTP_ATTEMPTS_CACHE_KEY.format(self.phone_number): 0,
+        })
+    
+    def tearDown(self):
+        cache.delete_many([
+            DRIVER_OTP_CACHE_KEY.format(self.phone_number),
+            DRIVER_OTP_ATTEMPTS_CACHE_KEY.format(self.phone_number),
+        ])
+    
+    def test_verify_non_ascii_otp_rejected(self):
+        """Test a non-ASCII OTP is refused rather than erroring"""
+        response = self.client.post('/api/v1/driver/verify-otp/', {
+            'phone_number': self.phone_number,
+            'otp': '\uff11\uff12\uff13\uff14\uff15\uff16'
+        }, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
 class ProductCatalogTestCase(TestCase):
     """Test product catalog endpoints"""
     
@@ -236,61 +270,69 @@ class ProductCatalogTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['name'], 'Mango')
         self.assertEqual(len(response.data['variants']), 1)
+    
+    def test_get_product_details_unknown_market(self):
+        """Test product detail rejects an unknown market_id"""
+        response = self.client.get(
+            f'/api/v1/products/{self.product.id}/', {'market_id': str(uuid.uuid4())}
+        )
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'Invalid or unknown market_id'})
 
 
 class CartTestCase(TestCase):
     """Test cart management endpoints"""
     
-    def setUp(self):
-        self.client = APIClient()
-        
+    @classmethod
+    def setUpTestData(cls):
         # Create customer user
-        self.customer_user = User.objects.create_user(
+        cls.customer_user = User.objects.create_user(
             phone_number='+255712345678',
             password='testpass123',
             user_type='customer'
         )
-        self.customer = Customer.objects.create(
-            user=self.customer_user,
+        cls.customer = Customer.objects.create(
+            user=cls.customer_user,
             names='John Doe'
         )
         
         # Setup products
-        self.category = Category.objects.create(
+        cls.category = Category.objects.create(
             name='Fruits',
             profit_percentage=Decimal('20.00')
         )
         
-        self.unit_type = MeasurementUnitType.objects.create(
+        cls.unit_type = MeasurementUnitType.objects.create(
             name='Weight',
             base_unit_name='gram'
         )
-        self.unit = MeasurementUnit.objects.create(
-            unit_type=self.unit_type,
+        cls.unit = MeasurementUnit.objects.create(
+            unit_type=cls.unit_type,
             name='Kilogram',
             symbol='kg'
         )
         
-        self.product = ProductTemplate.objects.create(
+        cls.product = ProductTemplate.objects.create(
             name='Mango',
-            category=self.category,
-            primary_unit_type=self.unit_type,
+            category=cls.category,
+            primary_unit_type=cls.unit_type,
             is_active=True,
             is_verified=True
         )
-        self.product.available_units.add(self.unit)
+        cls.product.available_units.add(cls.unit)
         
         # Setup market and vendor
-        self.market = Market.objects.create(name='Darajani Market', location='Stone Town')
-        self.market_zone = MarketZone.objects.create(market=self.market, name='Sokoni la Matunda')
+        cls.market = Market.objects.create(name='Darajani Market', location='Stone Town')
+        cls.market_zone = MarketZone.objects.create(market=cls.market, name='Sokoni la Matunda')
         
-        self.vendor_user = User.objects.create_user(
+        cls.vendor_user = User.objects.create_user(
             phone_number='+255712345679',
             password='vendor123',
             user_type='vendor'
         )
-        self.vendor = Vendor.objects.create(
-            user=self.vendor_user,
+        cls.vendor = Vendor.objects.create(
+            user=cls.vendor_user,
             names='Ali',
             business_name='Ali Farm',
             business_license='BL123',
@@ -298,34 +340,38 @@ class CartTestCase(TestCase):
             business_address='Stone Town'
         )
         
-        self.variant = ProductVariant.objects.create(
-            product_template=self.product,
-            vendor=self.vendor,
-            market_zone=self.market_zone,
+        cls.variant = ProductVariant.objects.create(
+            product_template=cls.product,
+            vendor=cls.vendor,
+            market_zone=cls.market_zone,
             is_active=True,
             is_approved=True
         )
         
-        self.unit_price = UnitPrice.objects.create(
-            product_variant=self.variant,
-            unit=self.unit,
+        cls.unit_price = UnitPrice.objects.create(
+            product_variant=cls.variant,
+            unit=cls.unit,
             cost_price=Decimal('2000.00')
         )
         
+        # Request payloads are built once for the whole test case
+        cls.ADD_TO_CART_PAYLOAD = {
+            'market_id': str(cls.market.id),
+            'product_variant_id': str(cls.variant.id),
+            'unit_id': str(cls.unit.id),
+            'quantity': '2.5',
+            'special_instructions': 'Peel the mango'
+        }
+    
+    def setUp(self):
+        self.client = APIClient()
+        
         # Login customer
         self.client.force_authenticate(user=self.customer_user)
     
     def test_add_to_cart(self):
         """Test adding item to cart"""
-        data = {
-            'market_id': str(self.market.id),
-            'product_variant_id': str(self.variant.id),
-            'unit_id': str(self.unit.id),
-            'quantity': Decimal('2.5'),
-            'special_instructions': 'Peel the mango'
-        }
-        
-        response = self.client.post('/api/v1/cart/add/', data, format='json')
+        response = self.client.post('/api/v1/cart/add/', self.ADD_TO_CART_PAYLOAD, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['message'], 'Item added to cart')
@@ -354,20 +400,19 @@ class CartTestCase(TestCase):
 class OrderTestCase(TestCase):
     """Test order creation and management"""
     
-    def setUp(self):
-        self.client = APIClient()
-        
+    @classmethod
+    def setUpTestData(cls):
         # Setup customer
-        self.customer_user = User.objects.create_user(
+        cls.customer_user = User.objects.create_user(
             phone_number='+255712345678',
             password='testpass123',
             user_type='customer'
         )
-        self.customer = Customer.objects.create(user=self.customer_user, names='John Doe')
+        cls.customer = Customer.objects.create(user=cls.customer_user, names='John Doe')
         
         # Setup market and delivery zone
-        self.market = Market.objects.create(name='Darajani Market', location='Stone Town')
-        self.market_zone = MarketZone.objects.create(market=self.market, name='Sokoni')
+        cls.market = Market.objects.create(name='Darajani Market', location='Stone Town')
+        cls.market_zone = MarketZone.objects.create(market=cls.market, name='Sokoni')
         
         config = DeliveryFeeConfig.objects.create(
             name='Default',
@@ -376,52 +421,52 @@ class OrderTestCase(TestCase):
             is_default=True
         )
         
-        self.delivery_zone = DeliveryZone.objects.create(
-            market=self.market,
+        cls.delivery_zone = DeliveryZone.objects.create(
+            market=cls.market,
             name='Zone A',
             zone_type='standard',
             is_active=True
         )
         
         # Setup address
-        self.address = CustomerAddress.objects.create(
-            customer=self.customer,
-            market=self.market,
+        cls.address = CustomerAddress.objects.create(
+            customer=cls.customer,
+            market=cls.market,
             label='Home',
             street_address='House 123',
             latitude=Decimal('-6.1599'),
             longitude=Decimal('39.1925'),
             recipient_name='John Doe',
             recipient_phone='+255712345678',
-            delivery_zone=self.delivery_zone
+            delivery_zone=cls.delivery_zone
         )
         
         # Setup products
-        self.category = Category.objects.create(name='Fruits')
-        self.unit_type = MeasurementUnitType.objects.create(name='Weight', base_unit_name='gram')
-        self.unit = MeasurementUnit.objects.create(
-            unit_type=self.unit_type,
+        cls.category = Category.objects.create(name='Fruits')
+        cls.unit_type = MeasurementUnitType.objects.create(name='Weight', base_unit_name='gram')
+        cls.unit = MeasurementUnit.objects.create(
+            unit_type=cls.unit_type,
             name='kg',
             symbol='kg'
         )
         
-        self.product = ProductTemplate.objects.create(
+        cls.product = ProductTemplate.objects.create(
             name='Mango',
-            category=self.category,
-            primary_unit_type=self.unit_type,
+            category=cls.category,
+            primary_unit_type=cls.unit_type,
             is_active=True,
             is_verified=True
         )
-        self.product.available_units.add(self.unit)
+        cls.product.available_units.add(cls.unit)
         
         # Setup vendor
-        self.vendor_user = User.objects.create_user(
+        cls.vendor_user = User.objects.create_user(
             phone_number='+255712345679',
             password='vendor123',
             user_type='vendor'
         )
-        self.vendor = Vendor.objects.create(
-            user=self.vendor_user,
+        cls.vendor = Vendor.objects.create(
+            user=cls.vendor_user,
             names='Ali',
             business_name='Ali Farm',
             business_license='BL123',
@@ -429,45 +474,52 @@ class OrderTestCase(TestCase):
             business_address='Stone Town'
         )
         
-        self.variant = ProductVariant.objects.create(
-            product_template=self.product,
-            vendor=self.vendor,
-            market_zone=self.market_zone,
+        cls.variant = ProductVariant.objects.create(
+            product_template=cls.product,
+            vendor=cls.vendor,
+            market_zone=cls.market_zone,
             is_active=True,
             is_approved=True
         )
         
-        self.unit_price = UnitPrice.objects.create(
-            product_variant=self.variant,
-            unit=self.unit,
+        cls.unit_price = UnitPrice.objects.create(
+            product_variant=cls.variant,
+            unit=cls.unit,
             cost_price=Decimal('2000.00')
         )
         
+        # Request payloads are built once for the whole test case
+        cls.CREATE_ORDER_PAYLOAD = {
+            'market_id': str(cls.market.id),
+            'delivery_address_id': str(cls.address.id),
+            'customer_latitude': '-6.1599',
+            'customer_longitude': '39.1925',
+            'payment_method': 'cash_on_delivery'
+        }
+        cls.CART_ITEM_FIELDS = {
+            'product_variant': cls.variant,
+            'measurement_unit': cls.unit,
+            'quantity': Decimal('2.5'),
+            'unit_price': cls.unit_price.selling_price
+        }
+    
+    def setUp(self):
+        self.client = APIClient()
+        
         # Login customer
         self.client.force_authenticate(user=self.customer_user)
+        
+        # Every test orders from a cart holding one item
+        self._add_cart_item()
+    
+    def _add_cart_item(self):
+        cart = Cart.objects.create(customer=self.customer_user, market=self.market)
+        CartItem.objects.create(cart=cart, **self.CART_ITEM_FIELDS)
     
     def test_create_order(self):
         """Test order creation from cart"""
-        # Add item to cart
-        cart = Cart.objects.create(customer=self.customer_user, market=self.market)
-        CartItem.objects.create(
-            cart=cart,
-            product_variant=self.variant,
-            measurement_unit=self.unit,
-            quantity=Decimal('2.5'),
-            unit_price=self.unit_price.selling_price
-        )
-        
         # Create order
-        data = {
-            'market_id': str(self.market.id),
-            'delivery_address_id': str(self.address.id),
-            'customer_latitude': '-6.1599',
-            'customer_longitude': '39.1925',
-            'payment_method': 'cash_on_delivery'
-        }
-        
-        response = self.client.post('/api/v1/orders/create_order/', data, format='json')
+        response = self.client.post('/api/v1/orders/create_order/', self.CREATE_ORDER_PAYLOAD, format='json')
         
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertEqual(response.data['message'], 'Order created successfully')
@@ -477,6 +529,221 @@ class OrderTestCase(TestCase):
         order = Order.objects.get(id=response.data['order']['id'])
         self.assertEqual(order.status, 'pending')
         self.assertEqual(order.items.count(), 1)
+    
+    def test_create_order_same_idempotency_key_replays_order(self):
+        """A retried submit with the same Idempotency-Key returns the first order"""
+        first = self.client.post(
+            '/api/v1/orders/create_order/', self.CREATE_ORDER_PAYLOAD,
+            format='json', HTTP_IDEMPOTENCY_KEY='submit-1'
+        )
+        retry = self.client.post(
+            '/api/v1/orders/create_order/', self.CREATE_ORDER_PAYLOAD,
+            format='json', HTTP_IDEMPOTENCY_KEY='submit-1'
+        )
+        
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry.data['order']['id'], first.data['order']['id'])
+        self.assertEqual(Order.objects.filter(customer=self.customer_user).count(), 1)
+    
+    def test_create_order_new_idempotency_key_creates_new_order(self):
+        """A different Idempotency-Key is a new submit"""
+        first = self.client.post(
+            '/api/v1/orders/create_order/', self.CREATE_ORDER_PAYLOAD,
+            format='json', HTTP_IDEMPOTENCY_KEY='submit-1'
+        )
+        
+        # The first order cleared the cart
+        self._add_cart_item()
+        second = self.client.post(
+            '/api/v1/orders/create_order/', self.CREATE_ORDER_PAYLOAD,
+            format='json', HTTP_IDEMPOTENCY_KEY='submit-2'
+        )
+        
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(second.status_code, status.HTTP_201_CREATED)
+        self.assertNotEqual(second.data['order']['id'], first.data['order']['id'])
+        self.assertEqual(Order.objects.filter(customer=self.customer_user).count(), 2)
+    
+    def test_order_driver_location_follows_driver_pings(self):
+        """The customer sees the latest position recorded for their order"""
+        from api.driver_order_helpers import record_driver_location
+        
+        created = self.client.post('/api/v1/orders/create_order/', self.CREATE_ORDER_PAYLOAD, format='json')
+        order = Order.objects.get(id=created.data['order']['id'])
+        url = f'/api/v1/orders/{order.id}/driver_location/'
+        
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['driver_location'])
+        
+        record_driver_location(order, -6.16, 39.19)
+        response = self.client.get(url)
+        self.assertEqual(response.data['driver_location']['latitude'], -6.16)
+        self.assertEqual(response.data['driver_location']['longitude'], 39.19)
+
+
+class DriverOrderTestCase(TestCase):
+    """Test drivers claiming available orders"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer_user = User.objects.create_user(
+            phone_number='+255712345680',
+            password='testpass123',
+            user_type='customer'
+        )
+        Customer.objects.create(user=cls.customer_user, names='Jane Doe')
+        
+        cls.market = Market.objects.create(name='Mwanakwerekwe Market', location='Mwanakwerekwe')
+        cls.address = CustomerAddress.objects.create(
+            customer=cls.customer_user,
+            market=cls.market,
+            label='Home',
+            street_address='House 9',
+            latitude=Decimal('-6.1599'),
+            longitude=Decimal('39.1925'),
+            recipient_name='Jane Doe',
+            recipient_phone='+255712345680'
+        )
+        
+        cls.driver_user = User.objects.create_user(
+            phone_number='+255712345681',
+            password='driverpass123',
+            user_type='driver'
+        )
+        cls.other_driver_user = User.objects.create_user(
+            phone_number='+255712345682',
+            password='driverpass123',
+            user_type='driver'
+        )
+        for number, user in enumerate([cls.driver_user, cls.other_driver_user], start=1):
+            Driver.objects.create(
+                user=user,
+                names=f'Driver {number}',
+                license_number=f'DL-{number}',
+                vehicle_type='motorcycle',
+                vehicle_plate=f'Z {number}00 AA',
+                is_approved='approved'
+            )
+        
+        # Order rows are built from these fields, ready for pickup by default
+        cls.ORDER_FIELDS = {
+            'customer': cls.customer_user,
+            'delivery_address': cls.address,
+            'items_total': Decimal('1000.00'),
+            'delivery_fee': Decimal('500.00'),
+            'total_amount': Decimal('1500.00'),
+            'status': 'ready',
+            'scheduled_delivery_date': timezone.now().date(),
+            'scheduled_delivery_time': 'TBD'
+        }
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.order = Order.objects.create(**self.ORDER_FIELDS)
+        self.accept_url = f'/api/v1/driver/orders/{self.order.id}/accept_order/'
+        
+        # Login driver
+        self.client.force_authenticate(user=self.driver_user)
+    
+    def test_second_accept_leaves_first_driver_assigned(self):
+        """Only the first driver to accept gets the order"""
+        first = self.client.post(self.accept_url)
+        self.client.force_authenticate(user=self.other_driver_user)
+        second = self.client.post(self.accept_url)
+        
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.status_code, status.HTTP_400_BAD_REQUEST)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.driver, self.driver_user)
+        self.assertEqual(self.order.status, 'assigned')
+    
+    def test_cannot_accept_cancelled_order(self):
+        """Orders that are no longer awaiting pickup cannot be claimed"""
+        Order.objects.filter(id=self.order.id).update(status='cancelled')
+        
+        response = self.client.post(self.accept_url)
+        
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.order.refresh_from_db()
+        self.assertIsNone(self.order.driver)
+        self.assertEqual(self.order.status, 'cancelled')
+    
+    def test_unapproved_driver_cannot_accept_order(self):
+        """Driver accounts without an approved profile are refused"""
+        Driver.objects.filter(user=self.driver_user).update(is_approved='pending')
+        
+        response = self.client.post(self.accept_url)
+        
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.order.refresh_from_db()
+        self.assertIsNone(self.order.driver)
+    
+    def test_my_orders_unpaginated_by_default(self):
+        """Without cursor params the list is a plain array, latest assigned first"""
+        later = Order.objects.create(**self.ORDER_FIELDS)
+        now = timezone.now()
+        Order.objects.filter(id=self.order.id).update(
+            driver=self.driver_user, status='assigned', assigned_at=now
+        )
+        Order.objects.filter(id=later.id).update(
+            driver=self.driver_user, status='assigned', assigned_at=now - timedelta(hours=1)
+        )
+        
+        response = self.client.get('/api/v1/driver/orders/my_orders/')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsInstance(response.data, list)
+        self.assertEqual([o['id'] for o in response.data], [str(self.order.id), str(later.id)])
+    
+    def test_my_orders_cursor_pages_cover_every_order_once(self):
+        """Orders sharing a timestamp and lacking assigned_at still page cleanly"""
+        ids = [self.order.id] + [Order.objects.create(**self.ORDER_FIELDS).id for _ in range(2)]
+        # Assigned from the dashboard (no assigned_at) at the same instant
+        Order.objects.filter(id__in=ids).update(
+            driver=self.driver_user, status='assigned', assigned_at=None, created_at=timezone.now()
+        )
+        
+        seen = []
+        params = {'page_size': 1}
+        while True:
+            response = self.client.get('/api/v1/driver/orders/my_orders/', params)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(o['id'] for o in response.data['results'])
+            if not response.data['next']:
+                break
+            params = {'page_size': 1, 'cursor': parse_qs(urlparse(response.data['next']).query)['cursor'][0]}
+        
+        self.assertEqual(sorted(seen), sorted(str(order_id) for order_id in ids))
+
+
+class ORJSONRendererTestCase(SimpleTestCase):
+    """Test the orjson renderer writes the same bytes as DRF's JSONRenderer"""
+    
+    def test_matches_json_renderer(self):
+        data = {
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'created_at': datetime(2024, 5, 1, 8, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'delivery_date': date(2024, 5, 2),
+            'total_amount': Decimal('1500.50'),
+            'note': 'Mlango wa pili\u2028karibu na duka\u2029asante',
+            'items': [{'quantity': 2, 'name': 'Ndizi'}],
+        }
+        
+        rendered = ORJSONRenderer().render(data)
+        
+        self.assertEqual(rendered, JSONRenderer().render(data))
+        self.assertIn(b'"2024-05-01T08:30:15.123Z"', rendered)
+        self.assertIn(b'\\u2028', rendered)
+    
+    def test_non_finite_floats_render_as_null(self):
+        """Unlike the strict JSONRenderer, NaN and Infinity become null"""
+        data = {'distance_km': float('nan'), 'delivery_fee': float('inf')}
+        
+        self.assertEqual(ORJSONRenderer().render(data), b'{"distance_km":null,"delivery_fee":null}')
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(data)
 
 
 # Run tests with: python manage.py test api
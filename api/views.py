@@ -11,29 +11,47 @@ Endpoints for:
 from rest_framework import viewsets, status, generics
 from rest_framework.views import APIView
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.utils import timezone
-from django.db import transaction
-from django.db.models import Q, Count, Sum, Avg, F
+from django.db import transaction, connection, IntegrityError
+from django.db.models import Q, Count, Sum, Avg, F, Func, FloatField, Prefetch, Exists, OuterRef
 from django.db.models.functions import TruncDate, TruncWeek, TruncMonth
+from django.contrib.gis.geos import Point
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.measure import D
+from django.contrib.postgres.search import SearchQuery, SearchRank
 from django.utils import timezone
 from datetime import datetime, timedelta
 from decimal import Decimal
+from math import ceil
+import hmac
 import logging
+import re
+import uuid
 from django.http import Http404
 from django.conf import settings
+from django.core.cache import cache
 
 logger = logging.getLogger(__name__)
 
+# Pending driver login codes and their guess counters, keyed by phone number
+DRIVER_OTP_CACHE_KEY = 'driver_otp:{}'
+DRIVER_OTP_ATTEMPTS_CACHE_KEY = 'driver_otp_attempts:{}'
+
 from accounts.models import User, Customer, Driver, SecurityQuestion, UserSecurityAnswer
+from accounts.driver_cache import DRIVER_DETAILS_CACHE_KEY, DRIVER_DETAILS_CACHE_TTL
 from products.models import (
     ProductTemplate, ProductVariant, MeasurementUnit, UnitPrice,
     ProductAddon, ProductAddonMapping, FavoriteItem
 )
+from products.pricing_cache import pricing_cache_key, PRICING_CACHE_TTL, favorites_cache_key, FAVORITES_CACHE_TTL
 from markets.models import Market
 from location.models import CustomerAddress, DeliveryZone, DeliveryFeeConfig
+from location.pricing import calculation_method, compute_zone_fee, measure_km, to_cents
+from location.zone_cache import resolve_delivery_zones
 from order.models import Order, OrderItem, Cart, CartItem
 from order.cart_utils import CartService, CartCalculations, CartItemHelper
 
@@ -50,6 +68,8 @@ from .serializers import (
     # Cart
     CartSerializer, CartItemSerializer, CartItemCreateSerializer,
     CustomerAddressSerializer, CustomerAddressCreateSerializer,
+    # Delivery fees
+    DeliveryLocationSerializer, DeliveryFeeContextSerializer, DeliveryFeeCalculateSerializer,
     # Orders
     OrderListSerializer, AdminOrderListSerializer, OrderDetailSerializer, OrderCreateSerializer,
     OrderItemDetailSerializer,
@@ -60,9 +80,19 @@ from .serializers import (
 )
 
 # Import helper functions
+from .pagination import OptionalCursorPagination, OptionalOrderCursorPagination
 from .order_helpers import calculate_order_totals, validate_and_normalize_delivery_fee, format_order_response
 
 
+def _token_pair(user):
+    """Issue a refresh/access JWT pair for user, signing each token once"""
+    refresh = RefreshToken.for_user(user)
+    return {
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+    }
+
+
 class SecurityQuestionListView(generics.ListAPIView):
     """List active security questions (for registration UI)"""
     permission_classes = [AllowAny]
@@ -90,14 +120,13 @@ class CustomerRegisterView(generics.CreateAPIView):
         user = customer.user
         
         # Generate tokens
-        refresh = RefreshToken.for_user(user)
+        tokens = _token_pair(user)
         
         return Response({
             'message': 'Registration successful',
             'customer_id': str(customer.user.id),
             'phone_number': user.phone_number,
-            'access': str(refresh.access_token),
-            'refresh': str(refresh),
+            **tokens,
         }, status=status.HTTP_201_CREATED)
 
 
@@ -112,14 +141,13 @@ class CustomerLoginView(generics.GenericAPIView):
         serializer.is_valid(raise_exception=True)
         
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        tokens = _token_pair(user)
         
         return Response({
             'message': 'Login successful',
             'customer_id': str(user.id),
             'phone_number': user.phone_number,
-            'access': str(refresh.access_token),
-            'refresh': str(refresh),
+            **tokens,
         })
 
 
@@ -134,7 +162,7 @@ class AdminLoginView(generics.GenericAPIView):
         serializer.is_valid(raise_exception=True)
         
         user = serializer.validated_data['user']
-        refresh = RefreshToken.for_user(user)
+        tokens = _token_pair(user)
         
         return Response({
             'message': 'Admin login successful',
@@ -142,8 +170,7 @@ class AdminLoginView(generics.GenericAPIView):
             'phone_number': user.phone_number,
             'names': getattr(user, 'names', ''),
             'email': getattr(user, 'email', ''),
-            'access': str(refresh.access_token),
-            'refresh': str(refresh),
+            **tokens,
             'is_superuser': user.is_superuser,
             'is_staff': user.is_staff,
         })
@@ -160,12 +187,13 @@ class ForgotPasswordRequestView(generics.GenericAPIView):
         serializer.is_valid(raise_exception=True)
         
         phone_number = serializer.validated_data['phone_number']
-        user = User.objects.get(phone_number=phone_number, user_type='customer')
         
-        # Get user's security answers (only question IDs, not answers)
+        # Get user's security questions (not answers) in one joined query;
+        # the serializer has already confirmed the customer exists
         questions = SecurityQuestion.objects.filter(
             is_active=True,
-            usersecurityanswer__user=user
+            usersecurityanswer__user__phone_number=phone_number,
+            usersecurityanswer__user__user_type='customer'
         ).values('id', 'question')
         
         return Response({
@@ -190,24 +218,29 @@ class ForgotPasswordVerifyView(generics.GenericAPIView):
         
         user = User.objects.get(phone_number=phone_number, user_type='customer')
         
+        # Load all saved answers for the submitted questions in one query
+        question_ids = [answer_data.get('question_id') for answer_data in answers]
+        saved_answers = {
+            str(saved.question_id): saved.answer.lower().strip()
+            for saved in UserSecurityAnswer.objects.filter(
+                user=user,
+                question_id__in=question_ids
+            ).only('question_id', 'answer')
+        }
+        
         # Verify all answers
         for answer_data in answers:
-            question_id = answer_data.get('question_id')
+            question_id = str(answer_data.get('question_id'))
             provided_answer = answer_data.get('answer', '').lower().strip()
             
-            try:
-                saved_answer = UserSecurityAnswer.objects.get(
-                    user=user,
-                    question_id=question_id
-                )
-                if saved_answer.answer.lower().strip() != provided_answer:
-                    return Response({
-                        'error': 'One or more security answers are incorrect.'
-                    }, status=status.HTTP_400_BAD_REQUEST)
-            except UserSecurityAnswer.DoesNotExist:
+            if question_id not in saved_answers:
                 return Response({
                     'error': 'Security question not found for this user.'
                 }, status=status.HTTP_400_BAD_REQUEST)
+            if saved_answers[question_id] != provided_answer:
+                return Response({
+                    'error': 'One or more security answers are incorrect.'
+                }, status=status.HTTP_400_BAD_REQUEST)
         
         # Reset password
         user.set_password(new_password)
@@ -223,13 +256,17 @@ class CustomerProfileView(generics.RetrieveUpdateAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = CustomerProfileSerializer
     
+    def get_queryset(self):
+        return Customer.objects.select_related('user')
+    
     def get_object(self):
-        return self.request.user.customer
+        return self.get_queryset().get(user=self.request.user)
 
 
 class DeliveryFeeCalculateView(generics.GenericAPIView):
     """Calculate delivery fee for a given market and delivery location"""
     permission_classes = [AllowAny]
+    serializer_class = DeliveryFeeCalculateSerializer
 
     def post(self, request, *args, **kwargs):
         """
@@ -247,18 +284,13 @@ class DeliveryFeeCalculateView(generics.GenericAPIView):
             "estimated_delivery_time": 30
         }
         """
-        from django.contrib.gis.geos import Point
-        
-        market_id = request.data.get('market_id')
-        customer_lat = request.data.get('customer_latitude')
-        customer_lng = request.data.get('customer_longitude')
-        order_total = Decimal(str(request.data.get('order_total', 0)))
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        if not market_id or customer_lat is None or customer_lng is None:
-            return Response(
-                {'error': 'market_id, customer_latitude, and customer_longitude are required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        market_id = serializer.validated_data['market_id']
+        customer_lat = serializer.validated_data['customer_latitude']
+        customer_lng = serializer.validated_data['customer_longitude']
+        order_total = serializer.validated_data['order_total']
         
         try:
             market = Market.objects.get(id=market_id, is_active=True)
@@ -273,93 +305,93 @@ class DeliveryFeeCalculateView(generics.GenericAPIView):
         if not market.geo_location:
             return Response({'error': 'Market does not have a geo_location set'}, status=status.HTTP_400_BAD_REQUEST)
 
-        distance_km = self._haversine_distance(
+        method = calculation_method(config)
+        distance_km = self._distance(
             market.geo_location.y, market.geo_location.x,
-            customer_lat, customer_lng
+            customer_lat, customer_lng,
+            method
         )
 
         # If distance exceeds configured maximum, return not available
-        if config and distance_km > (config.max_delivery_distance or Decimal('50')):
+        if config and distance_km > float(config.max_delivery_distance or 50):
             return Response({
                 'error': f'Delivery not available beyond {config.max_delivery_distance}km'
             }, status=status.HTTP_400_BAD_REQUEST)
 
+        # Fee math runs in integer cents like DeliveryZone.calculate_delivery_fee
         # Default delivery fee using base + per_km_rate (legacy)
-        if order_total >= (config.free_delivery_threshold if config else Decimal('0')):
-            legacy_fee = Decimal('0')
+        if order_total >= (float(config.free_delivery_threshold) if config else 0.0):
+            legacy_fee_cents = 0
         else:
-            legacy_fee = (config.base_fee if config else Decimal('0')) + (distance_km * (config.per_km_rate if config else Decimal('0')))
+            legacy_fee_cents = to_cents(config.base_fee if config else 0) + round(
+                distance_km * to_cents(config.per_km_rate if config else 0)
+            )
 
         # Tiered (bucket) fee: ceil(distance_km / step_km) * fee_per_step
-        from math import ceil
         step_km = float(getattr(config, 'distance_step_km', Decimal('0.1')))
-        fee_per_step = Decimal(str(getattr(config, 'fee_per_step', Decimal('0'))))
-        # Convert distance to float km
-        dist = float(distance_km)
-        steps = ceil(dist / step_km) if step_km > 0 else 0
-        tier_fee = fee_per_step * Decimal(steps)
+        fee_per_step_cents = to_cents(getattr(config, 'fee_per_step', 0))
+        steps = ceil(distance_km / step_km) if step_km > 0 else 0
+        tier_fee_cents = fee_per_step_cents * steps
 
-        estimated_time = int((config.min_delivery_time if config else 30) + (float(distance_km) * (config.delivery_time_estimate_per_km if config else 0)))
+        estimated_time = int((config.min_delivery_time if config else 30) + (distance_km * (config.delivery_time_estimate_per_km if config else 0)))
 
         return Response({
-            'delivery_fee': float(legacy_fee),
-            'tier_fee': float(tier_fee),
-            'distance_km': float(distance_km),
+            'delivery_fee': legacy_fee_cents / 100,
+            'tier_fee': tier_fee_cents / 100,
+            'distance_km': distance_km,
             'estimated_delivery_time': estimated_time,
-            'tier_step_km': float(step_km),
-            'tier_fee_per_step': float(fee_per_step),
+            'tier_step_km': step_km,
+            'tier_fee_per_step': fee_per_step_cents / 100,
+            'calculation_method': method,
         })
     
-    def _haversine_distance(self, lat1, lng1, lat2, lng2):
-        """Calculate distance between two points in km"""
-        from math import radians, sin, cos, sqrt, atan2
-        
-        R = 6371  # Earth radius in km
-        lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-        dlat = lat2 - lat1
-        dlng = lng2 - lng1
-        a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return Decimal(str(R * c))
+    def _distance(self, lat1, lng1, lat2, lng2, method):
+        """Calculate distance between two points in km with the config's method"""
+        return measure_km(float(lat1), float(lng1), float(lat2), float(lng2), method)
     
-    def _calculate_zone_fee(self, zone, order_total, distance_km=None):
+    def _calculate_zone_fee(self, zone, order_total, distance_km=None, config=None):
         """Calculate fee based on zone type"""
-        config = DeliveryFeeConfig.get_active_config()
+        if config is None:
+            config = DeliveryFeeConfig.get_active_config()
         
-        if zone.zone_type == 'fixed':
-            fee = zone.fixed_price or Decimal('0')
-        elif zone.zone_type == 'free':
-            fee = Decimal('0')
-        elif zone.zone_type == 'unavailable':
+        fee, _, reason = compute_zone_fee(zone, config, distance_km, order_total)
+        if fee is None:
             return Response(
-                {'error': f'Delivery not available to {zone.name}'},
+                {'error': reason},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        elif zone.zone_type == 'surcharge':
-            base_fee = config.base_fee if config else Decimal('1000')
-            surcharge = base_fee * (zone.surcharge_percent or Decimal('0')) / 100
-            fee = base_fee + surcharge
-        else:  # standard (distance-based)
-            if order_total >= (config.free_delivery_threshold if config else Decimal('50000')):
-                fee = Decimal('0')
-            else:
-                base_fee = config.base_fee if config else Decimal('1000')
-                km_rate = config.per_km_rate if config else Decimal('500')
-                fee = base_fee + (distance_km * km_rate if distance_km else Decimal('0'))
         
         estimated_time = zone.estimated_delivery_time or 30
         
         return Response({
-            'delivery_fee': float(fee),
+            'delivery_fee': round(fee, 2),
             'zone_name': zone.name,
-            'distance_km': float(distance_km) if distance_km else 0,
+            'distance_km': distance_km or 0,
             'estimated_delivery_time': estimated_time,
         })
 
 
+def _with_coordinates(markets):
+    """Annotate markets with float lat/lng read in SQL, skipping GEOS parsing"""
+    return markets.annotate(
+        lat=Func('geo_location', function='ST_Y', output_field=FloatField()),
+        lng=Func('geo_location', function='ST_X', output_field=FloatField()),
+    )
+
+
+def _zones_by_market(market_ids, customer_point):
+    """
+    Resolve the applicable delivery zone for several markets from the zone
+    cache. A zone containing the customer wins; otherwise the highest
+    priority zone with a center point is used.
+    """
+    return resolve_delivery_zones(market_ids, customer_point)
+
+
 class NearestMarketView(generics.GenericAPIView):
     """Find the market with lowest delivery fee for a given customer location"""
     permission_classes = [AllowAny]
+    serializer_class = DeliveryLocationSerializer
     
     def post(self, request, *args, **kwargs):
         """
@@ -389,120 +421,57 @@ class NearestMarketView(generics.GenericAPIView):
             "note": "Lowest fee among 5 available markets"
         }
         """
-        from django.contrib.gis.geos import Point
-        from django.contrib.gis.db.models.functions import Distance
-        from math import radians, sin, cos, sqrt, atan2, ceil
-        
-        customer_lat = request.data.get('latitude')
-        customer_lng = request.data.get('longitude')
-        order_total = Decimal(str(request.data.get('order_total', 0)))
-        
-        if customer_lat is None or customer_lng is None:
-            return Response(
-                {'success': False, 'error': 'latitude and longitude are required'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        try:
-            customer_lat = float(customer_lat)
-            customer_lng = float(customer_lng)
-        except (ValueError, TypeError):
-            return Response(
-                {'success': False, 'error': 'latitude and longitude must be valid numbers'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        customer_lat = serializer.validated_data['latitude']
+        customer_lng = serializer.validated_data['longitude']
+        order_total = serializer.validated_data['order_total']
         
         # Get all active markets
         markets = Market.objects.filter(is_active=True, geo_location__isnull=False)
-        if not markets.exists():
-            return Response({
-                'success': False,
-                'error': 'No markets available',
-                'markets_checked': 0,
-            }, status=status.HTTP_404_NOT_FOUND)
         
         config = DeliveryFeeConfig.get_active_config()
         max_distance = float(config.max_delivery_distance) if config else 50.0
+        method = calculation_method(config)
         
         best_market = None
         lowest_fee = float('inf')
         best_zone = None
         best_distance = 0
-        markets_checked = 0
-        
-        # Helper: Haversine distance calculation
-        def haversine(lat1, lng1, lat2, lng2):
-            R = 6371  # Earth radius in km
-            lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-            dlat = lat2 - lat1
-            dlng = lng2 - lng1
-            a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            return R * c
-        
-        # Check each market
-        for market in markets:
-            markets_checked += 1
-            market_lat = float(market.geo_location.y)
-            market_lng = float(market.geo_location.x)
-            
-            distance_km = haversine(customer_lat, customer_lng, market_lat, market_lng)
-            
-            # Skip if beyond max delivery distance
-            if distance_km > max_distance:
-                continue
-            
-            # Try to find applicable delivery zone for this market
-            customer_point = Point(customer_lng, customer_lat, srid=4326)
-            
-            # Find zones that contain the customer location
-            zones = DeliveryZone.objects.filter(
-                market=market,
-                is_active=True,
-                boundary__contains=customer_point
-            ).order_by('priority')
-            
-            # If no containing zone, find nearest by center point
-            if not zones.exists():
-                zones = DeliveryZone.objects.filter(
-                    market=market,
-                    is_active=True,
-                    center_point__isnull=False
-                ).order_by('priority')
-            
-            if zones.exists():
-                zone = zones.first()
-            else:
-                # Use default zone calculation
-                zone = None
+        
+        # Let PostGIS drop markets beyond max delivery distance, so only
+        # candidates leave the database; fees use the config's distance method
+        customer_point = Point(customer_lng, customer_lat, srid=4326)
+        nearby_markets = _with_coordinates(markets).annotate(
+            distance=Distance('geo_location', customer_point)
+        ).filter(distance__lte=D(km=max_distance)).defer('geo_location').order_by('distance')
+        
+        candidates = [
+            (market, measure_km(customer_lat, customer_lng, market.lat, market.lng, method))
+            for market in nearby_markets
+        ]
+        markets_checked = len(candidates)
+        
+        # Only the empty case needs a second look to pick the right error
+        if not candidates and not markets.exists():
+            return Response({
+                'success': False,
+                'error': 'No markets available',
+                'markets_checked': 0,
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        # Resolve applicable delivery zones for all candidate markets at once
+        zones_by_market = _zones_by_market([market.id for market, _ in candidates], customer_point)
+        
+        for market, distance_km in candidates:
+            # No zone found means default zone calculation
+            zone = zones_by_market.get(market.id)
             
             # Calculate fee for this market
-            if zone:
-                if zone.zone_type == 'unavailable':
-                    continue  # Skip unavailable zones
-                elif zone.zone_type == 'fixed':
-                    fee = float(zone.fixed_price or 0)
-                elif zone.zone_type == 'free':
-                    fee = 0.0
-                elif zone.zone_type == 'surcharge':
-                    base = float(config.base_fee) if config else 1000
-                    surcharge_pct = float(zone.surcharge_percent or 0)
-                    fee = base * (1 + surcharge_pct / 100)
-                else:  # standard
-                    if order_total >= (config.free_delivery_threshold if config else 50000):
-                        fee = 0.0
-                    else:
-                        base_fee = float(config.base_fee) if config else 1000
-                        km_rate = float(config.per_km_rate) if config else 500
-                        fee = base_fee + (distance_km * km_rate)
-            else:
-                # No zone info, use default calculation
-                if order_total >= (config.free_delivery_threshold if config else 50000):
-                    fee = 0.0
-                else:
-                    base_fee = float(config.base_fee) if config else 1000
-                    km_rate = float(config.per_km_rate) if config else 500
-                    fee = base_fee + (distance_km * km_rate)
+            fee, _, _ = compute_zone_fee(zone, config, distance_km, order_total)
+            if fee is None:
+                continue  # Skip unavailable zones
             
             # Track market with lowest fee
             if fee < lowest_fee:
@@ -531,8 +500,8 @@ class NearestMarketView(generics.GenericAPIView):
             'market': {
                 'id': str(best_market.id),
                 'name': best_market.name,
-                'latitude': float(best_market.geo_location.y),
-                'longitude': float(best_market.geo_location.x),
+                'latitude': best_market.lat,
+                'longitude': best_market.lng,
                 'description': best_market.description,
                 'contact_phone': best_market.contact_phone,
             },
@@ -542,7 +511,7 @@ class NearestMarketView(generics.GenericAPIView):
                 'zone_id': str(best_zone.id) if best_zone else None,
                 'zone_name': best_zone.name if best_zone else 'Default',
                 'estimated_time': estimated_time,
-                'calculation_method': 'haversine',
+                'calculation_method': method,
             },
             'note': f'Lowest fee among {markets_checked} available markets',
         }, status=status.HTTP_200_OK)
@@ -551,6 +520,7 @@ class NearestMarketView(generics.GenericAPIView):
 class CalculateDeliveryFeeContextView(generics.GenericAPIView):
     """Calculate delivery fee considering order total for free delivery threshold"""
     permission_classes = [AllowAny]
+    serializer_class = DeliveryFeeContextSerializer
     
     def post(self, request, *args, **kwargs):
         """
@@ -575,60 +545,34 @@ class CalculateDeliveryFeeContextView(generics.GenericAPIView):
             "estimated_delivery_time": 45
         }
         """
-        from django.contrib.gis.geos import Point
-        from math import radians, sin, cos, sqrt, atan2, ceil
-        
-        market_id = request.data.get('market_id')
-        customer_lat = request.data.get('latitude')
-        customer_lng = request.data.get('longitude')
-        order_total = request.data.get('order_total')
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
-        # Validate required fields
-        if not market_id or customer_lat is None or customer_lng is None or order_total is None:
-            return Response({
-                'success': False,
-                'error': 'market_id, latitude, longitude, and order_total are required'
-            }, status=status.HTTP_400_BAD_REQUEST)
+        customer_lat = serializer.validated_data['latitude']
+        customer_lng = serializer.validated_data['longitude']
+        order_total = serializer.validated_data['order_total']
         
         try:
-            market = Market.objects.get(id=market_id, is_active=True)
+            market = Market.objects.get(id=serializer.validated_data['market_id'], is_active=True)
         except Market.DoesNotExist:
             return Response({
                 'success': False,
                 'error': 'Market not found'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        try:
-            customer_lat = float(customer_lat)
-            customer_lng = float(customer_lng)
-            order_total = Decimal(str(order_total))
-        except (ValueError, TypeError):
-            return Response({
-                'success': False,
-                'error': 'latitude, longitude, and order_total must be valid numbers'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
         if not market.geo_location:
             return Response({
                 'success': False,
                 'error': 'Market does not have a geo_location set'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Calculate distance using Haversine
-        def haversine(lat1, lng1, lat2, lng2):
-            R = 6371  # Earth radius in km
-            lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-            dlat = lat2 - lat1
-            dlng = lng2 - lng1
-            a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            return R * c
-        
+        # Calculate distance with the config's method
+        config = DeliveryFeeConfig.get_active_config()
+        method = calculation_method(config)
         market_lat = float(market.geo_location.y)
         market_lng = float(market.geo_location.x)
-        distance_km = haversine(customer_lat, customer_lng, market_lat, market_lng)
+        distance_km = measure_km(customer_lat, customer_lng, market_lat, market_lng, method)
         
-        config = DeliveryFeeConfig.get_active_config()
         max_distance = float(config.max_delivery_distance) if config else 50.0
         
         # Check if beyond max delivery distance
@@ -640,89 +584,38 @@ class CalculateDeliveryFeeContextView(generics.GenericAPIView):
                 'actual_distance_km': round(distance_km, 2),
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Find applicable delivery zone
-        customer_point = Point(customer_lng, customer_lat, srid=4326)
-        
-        zones = DeliveryZone.objects.filter(
-            market=market,
-            is_active=True,
-            boundary__contains=customer_point
-        ).order_by('priority')
-        
-        if not zones.exists():
-            zones = DeliveryZone.objects.filter(
-                market=market,
-                is_active=True,
-                center_point__isnull=False
-            ).order_by('priority')
-        
-        zone = zones.first() if zones.exists() else None
-        
-        # Calculate delivery fee
-        delivery_fee = Decimal('0.00')
-        reason = ''
-        fee_breakdown = {
-            'base_fee': 0,
-            'surcharge': 0,
-            'discount_applied': None,
-        }
+        # Calculate delivery fee (integer cents inside compute_zone_fee)
         estimated_time = 30
         
-        # Check free delivery threshold first
-        free_threshold = config.free_delivery_threshold if config else Decimal('50000')
+        # Check free delivery threshold first: it overrides every zone rule here,
+        # so large orders skip the zone lookups entirely
+        free_threshold = float(config.free_delivery_threshold) if config else 50000.0
         
         if order_total >= free_threshold:
-            delivery_fee = Decimal('0.00')
-            reason = f'Free delivery because order total ({float(order_total):.2f}) >= free threshold ({float(free_threshold):.2f})'
-            fee_breakdown['discount_applied'] = 'free_delivery_threshold'
+            delivery_fee, fee_breakdown, reason = compute_zone_fee(None, config, distance_km, order_total)
         else:
+            # Find applicable delivery zone
+            customer_point = Point(customer_lng, customer_lat, srid=4326)
+            zone = _zones_by_market([market.id], customer_point).get(market.id)
+            
             # Apply zone-specific pricing
+            delivery_fee, fee_breakdown, reason = compute_zone_fee(zone, config, distance_km, order_total)
+            if delivery_fee is None:
+                return Response({
+                    'success': False,
+                    'error': reason,
+                }, status=status.HTTP_400_BAD_REQUEST)
+            
             if zone:
-                if zone.zone_type == 'unavailable':
-                    return Response({
-                        'success': False,
-                        'error': f'Delivery not available to {zone.name}',
-                    }, status=status.HTTP_400_BAD_REQUEST)
-                elif zone.zone_type == 'fixed':
-                    delivery_fee = Decimal(str(zone.fixed_price or 0))
-                    reason = f'Fixed price zone: {zone.name}'
-                    fee_breakdown['base_fee'] = float(delivery_fee)
-                elif zone.zone_type == 'free':
-                    delivery_fee = Decimal('0.00')
-                    reason = f'Free delivery zone: {zone.name}'
-                    fee_breakdown['discount_applied'] = 'free_zone'
-                elif zone.zone_type == 'surcharge':
-                    base_fee = Decimal(str(config.base_fee)) if config else Decimal('1000')
-                    surcharge_pct = Decimal(str(zone.surcharge_percent or 0))
-                    surcharge_amt = (base_fee * surcharge_pct) / 100
-                    delivery_fee = base_fee + surcharge_amt
-                    reason = f'Surcharge zone {zone.name}: {surcharge_pct}% surcharge applied'
-                    fee_breakdown['base_fee'] = float(base_fee)
-                    fee_breakdown['surcharge'] = float(surcharge_amt)
-                else:  # standard
-                    base_fee = Decimal(str(config.base_fee)) if config else Decimal('1000')
-                    km_rate = Decimal(str(config.per_km_rate)) if config else Decimal('500')
-                    delivery_fee = base_fee + (Decimal(str(distance_km)) * km_rate)
-                    reason = f'Distance-based: {distance_km:.2f}km x {float(km_rate):.0f} TZS/km + {float(base_fee):.0f} TZS base'
-                    fee_breakdown['base_fee'] = float(base_fee)
-                
                 estimated_time = zone.estimated_delivery_time or 30
-            else:
-                # No zone info, use default config
-                base_fee = Decimal(str(config.base_fee)) if config else Decimal('1000')
-                km_rate = Decimal(str(config.per_km_rate)) if config else Decimal('500')
-                delivery_fee = base_fee + (Decimal(str(distance_km)) * km_rate)
-                reason = f'Default calculation: {distance_km:.2f}km x {float(km_rate):.0f} TZS/km + {float(base_fee):.0f} TZS base'
-                fee_breakdown['base_fee'] = float(base_fee)
-                
-                if config:
-                    estimated_time = int(config.min_delivery_time + (distance_km * config.delivery_time_estimate_per_km))
+            elif config:
+                estimated_time = int(config.min_delivery_time + (distance_km * config.delivery_time_estimate_per_km))
         
         return Response({
             'success': True,
-            'delivery_fee': float(delivery_fee),
+            'delivery_fee': round(delivery_fee, 2),
             'distance_km': round(distance_km, 2),
-            'calculation_method': 'haversine',
+            'calculation_method': method,
             'fee_breakdown': fee_breakdown,
             'reason': reason,
             'estimated_delivery_time': estimated_time,
@@ -736,85 +629,55 @@ class FeesForLocationView(generics.GenericAPIView):
     Response: {"success": true, "markets": [{"market": {...}, "delivery": {...}}, ...]}
     """
     permission_classes = [AllowAny]
+    serializer_class = DeliveryLocationSerializer
 
     def post(self, request, *args, **kwargs):
-        from django.contrib.gis.geos import Point
-        from math import radians, sin, cos, sqrt, atan2
-
-        customer_lat = request.data.get('latitude')
-        customer_lng = request.data.get('longitude')
-        order_total = Decimal(str(request.data.get('order_total', 0)))
-
-        if customer_lat is None or customer_lng is None:
-            return Response({'success': False, 'error': 'latitude and longitude are required'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
 
-        try:
-            customer_lat = float(customer_lat)
-            customer_lng = float(customer_lng)
-        except (ValueError, TypeError):
-            return Response({'success': False, 'error': 'latitude and longitude must be valid numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        customer_lat = serializer.validated_data['latitude']
+        customer_lng = serializer.validated_data['longitude']
+        order_total = serializer.validated_data['order_total']
 
         markets = Market.objects.filter(is_active=True, geo_location__isnull=False)
-        if not markets.exists():
-            return Response({'success': False, 'error': 'No markets available', 'markets': []}, status=status.HTTP_404_NOT_FOUND)
 
         config = DeliveryFeeConfig.get_active_config()
         max_distance = float(config.max_delivery_distance) if config else 50.0
-
-        def haversine(lat1, lng1, lat2, lng2):
-            R = 6371
-            lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-            dlat = lat2 - lat1
-            dlng = lng2 - lng1
-            a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            return R * c
+        method = calculation_method(config)
 
         results = []
 
-        for market in markets:
-            market_lat = float(market.geo_location.y)
-            market_lng = float(market.geo_location.x)
-            distance_km = haversine(customer_lat, customer_lng, market_lat, market_lng)
-
-            if distance_km > max_distance:
-                continue
+        customer_point = Point(customer_lng, customer_lat, srid=4326)
+        # Ordered by distance so that standard-zone fees arrive already sorted
+        nearby_markets = _with_coordinates(markets).annotate(
+            distance=Distance('geo_location', customer_point)
+        ).filter(distance__lte=D(km=max_distance)).order_by('distance').defer('geo_location')
+
+        candidates = [
+            (market, market.lat, market.lng, measure_km(customer_lat, customer_lng, market.lat, market.lng, method))
+            for market in nearby_markets
+        ]
 
-            customer_point = Point(customer_lng, customer_lat, srid=4326)
+        if not candidates and not markets.exists():
+            return Response({'success': False, 'error': 'No markets available', 'markets': []}, status=status.HTTP_404_NOT_FOUND)
 
-            zones = DeliveryZone.objects.filter(market=market, is_active=True, boundary__contains=customer_point).order_by('priority')
-            if not zones.exists():
-                zones = DeliveryZone.objects.filter(market=market, is_active=True, center_point__isnull=False).order_by('priority')
+        zones_by_market = _zones_by_market([c[0].id for c in candidates], customer_point)
 
-            zone = zones.first() if zones.exists() else None
+        priced = []
+        for market, market_lat, market_lng, distance_km in candidates:
+            zone = zones_by_market.get(market.id)
 
             # Calculate fee (same rules as other views)
-            if zone:
-                if zone.zone_type == 'unavailable':
-                    continue
-                elif zone.zone_type == 'fixed':
-                    fee = float(zone.fixed_price or 0)
-                elif zone.zone_type == 'free':
-                    fee = 0.0
-                elif zone.zone_type == 'surcharge':
-                    base = float(config.base_fee) if config else 1000
-                    surcharge_pct = float(zone.surcharge_percent or 0)
-                    fee = base * (1 + surcharge_pct / 100)
-                else:
-                    if order_total >= (config.free_delivery_threshold if config else 50000):
-                        fee = 0.0
-                    else:
-                        base_fee = float(config.base_fee) if config else 1000
-                        km_rate = float(config.per_km_rate) if config else 500
-                        fee = base_fee + (distance_km * km_rate)
-            else:
-                if order_total >= (config.free_delivery_threshold if config else 50000):
-                    fee = 0.0
-                else:
-                    base_fee = float(config.base_fee) if config else 1000
-                    km_rate = float(config.per_km_rate) if config else 500
-                    fee = base_fee + (distance_km * km_rate)
+            fee, _, _ = compute_zone_fee(zone, config, distance_km, order_total)
+            if fee is None:
+                continue
+            priced.append((round(fee, 2), market, market_lat, market_lng, distance_km, zone))
 
+        # Sort by fee ascending. Only fixed/free/surcharge zones break the
+        # distance order, so this is a near-linear pass over a sorted list.
+        priced.sort(key=lambda p: p[0])
+
+        for fee, market, market_lat, market_lng, distance_km, zone in priced:
             results.append({
                 'market': {
                     'id': str(market.id),
@@ -824,16 +687,14 @@ class FeesForLocationView(generics.GenericAPIView):
                     'description': market.description,
                 },
                 'delivery': {
-                    'fee': round(float(fee), 2),
+                    'fee': fee,
                     'distance_km': round(distance_km, 2),
                     'zone_id': str(zone.id) if zone else None,
                     'zone_name': zone.name if zone else 'Default',
+                    'calculation_method': method,
                 }
             })
 
-        # Sort by fee ascending
-        results = sorted(results, key=lambda r: r['delivery']['fee'])
-
         return Response({'success': True, 'markets': results}, status=status.HTTP_200_OK)
 
 
@@ -848,11 +709,38 @@ class MarketListView(generics.ListAPIView):
     serializer_class = MarketListSerializer
 
 
+def _parse_uuid(value):
+    """UUID from a request parameter, or None if it is not a valid UUID"""
+    try:
+        return uuid.UUID(str(value))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _active_market_exists(market_id):
+    """Whether market_id names an active market; False for malformed ids"""
+    market_uuid = _parse_uuid(market_id)
+    if market_uuid is None:
+        return False
+    return Market.objects.filter(id=market_uuid, is_active=True).exists()
+
+
+def _sold_in_market(market_id):
+    """EXISTS filter for templates with an active, approved variant in the market"""
+    return Exists(ProductVariant.objects.filter(
+        product_template=OuterRef('pk'),
+        market_zone__market_id=market_id,
+        is_active=True,
+        is_approved=True
+    ))
+
+
 class ProductTemplateViewSet(viewsets.ReadOnlyModelViewSet):
     """Product templates (catalog items)"""
     permission_classes = [AllowAny]
     serializer_class = ProductTemplateListSerializer
     queryset = ProductTemplate.objects.filter(is_active=True, is_verified=True)
+    pagination_class = OptionalCursorPagination
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -865,16 +753,34 @@ class ProductTemplateViewSet(viewsets.ReadOnlyModelViewSet):
 
         if market_id:
             # Validate market_id and ensure market exists
-            try:
-                market = Market.objects.get(id=market_id, is_active=True)
-            except (Market.DoesNotExist, ValueError):
+            if not _active_market_exists(market_id):
+                if getattr(self, 'action', None) == 'retrieve':
+                    raise ValidationError({'error': 'Invalid or unknown market_id'})
                 return queryset.none()
 
-            queryset = queryset.filter(
-                variants__market_zone__market_id=market.id,
-                variants__is_active=True,
-                variants__is_approved=True,
-            ).distinct()
+            queryset = queryset.filter(_sold_in_market(market_id))
+
+        if getattr(self, 'action', None) == 'retrieve':
+            # Load only the variants the detail serializer will show
+            variants = ProductVariant.objects.filter(is_active=True, is_approved=True)
+            if market_id:
+                variants = variants.filter(market_zone__market_id=market_id)
+            queryset = queryset.select_related('category').prefetch_related(
+                Prefetch(
+                    'variants',
+                    queryset=variants.select_related(
+                        'vendor__user', 'market_zone', 'product_template__category'
+                    ).prefetch_related(
+                        Prefetch('unit_prices', queryset=UnitPrice.objects.select_related('unit')),
+                        Prefetch(
+                            'available_addons',
+                            queryset=ProductAddonMapping.objects.filter(is_active=True).select_related('addon'),
+                            to_attr='active_addon_mappings'
+                        )
+                    ),
+                    to_attr='filtered_variants'
+                )
+            )
 
         return queryset
     
@@ -920,23 +826,11 @@ class ProductTemplateViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
     
     def retrieve(self, request, *args, **kwargs):
-        """Get product detail. If market_id provided, filter variants to that market only"""
+        """
+        Get product detail. If market_id provided, filter variants to that market only.
+        Unknown markets are rejected with 400 by get_queryset.
+        """
         instance = self.get_object()
-        market_id = request.query_params.get('market_id')
-        
-        if market_id:
-            # Filter variants to only those from vendors in the selected market
-            try:
-                market = Market.objects.get(id=market_id, is_active=True)
-                # Store market context so serializer can use it
-                request.market_id = market_id
-                request.market = market
-            except (Market.DoesNotExist, ValueError):
-                # If market is invalid, return error
-                return Response(
-                    {'error': 'Invalid or unknown market_id'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
         
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
@@ -951,21 +845,29 @@ class ProductTemplateViewSet(viewsets.ReadOnlyModelViewSet):
                 {'error': 'market_id query parameter required'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        # Validate market_id and ensure market exists (avoid passing invalid UUIDs to ORM)
-        try:
-            market = Market.objects.get(id=market_id, is_active=True)
-        except (Market.DoesNotExist, ValueError) as e:
-            # ValueError can happen if the provided id is not a valid UUID string
+        # Validate market_id and ensure market exists
+        if not _active_market_exists(market_id):
             return Response({'error': 'Invalid or unknown market_id'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Get products from vendors in this market's zones
         products = ProductTemplate.objects.filter(
+            _sold_in_market(market_id),
             is_active=True,
-            is_verified=True,
-            variants__market_zone__market_id=market.id,
-            variants__is_active=True,
-            variants__is_approved=True
-        ).distinct()
+            is_verified=True
+        ).select_related('category').prefetch_related(
+            Prefetch(
+                'variants',
+                queryset=ProductVariant.objects.filter(
+                    is_active=True,
+                    is_approved=True
+                ).select_related('vendor__user', 'market_zone').prefetch_related('unit_prices__unit'),
+                to_attr='approved_variants'
+            )
+        )
+        
+        page = self.paginate_queryset(products)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
         
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
@@ -986,68 +888,54 @@ class ProductTemplateViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            market = Market.objects.get(id=market_id, is_active=True)
-        except (Market.DoesNotExist, ValueError):
+        if not _active_market_exists(market_id):
             return Response({'error': 'Invalid or unknown market_id'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Get products from vendors in this market's zones
         products = ProductTemplate.objects.filter(
+            _sold_in_market(market_id),
             is_active=True,
-            is_verified=True,
-            variants__market_zone__market_id=market.id,
-            variants__is_active=True,
-            variants__is_approved=True
-        ).distinct()
-        
-        # Build response with pricing data
-        result = []
-        for product in products:
-            result.append(self._get_product_with_pricing(product))
+            is_verified=True
+        ).values(
+            'id', 'name', 'description', 'category__name', 'main_image',
+            'cached_max_price', 'cached_unit_symbol', 'is_active'
+        )
+        
+        page = self.paginate_queryset(products)
+        if page is not None:
+            return self.get_paginated_response(
+                [self._get_product_with_pricing(row) for row in page]
+            )
+        
+        # The full, unpaginated listing is cached per market
+        cache_key = pricing_cache_key(market_id)
+        result = cache.get(cache_key)
+        if result is None:
+            result = [self._get_product_with_pricing(row) for row in products]
+            cache.set(cache_key, result, PRICING_CACHE_TTL)
         
         return Response(result)
     
-    def _get_product_with_pricing(self, product):
+    def _get_product_with_pricing(self, row):
         """
-        Extract highest price and unit for a product.
-        Returns dict with product info + display_price + display_unit.
+        Build the response dict for a product values() row carrying its
+        cached display price and unit.
         """
-        from decimal import Decimal
-        
-        max_price = None
-        unit_symbol = 'pcs'
-        
-        # Find highest price across all variants' unit prices
-        for variant in product.variants.filter(is_active=True, is_approved=True):
-            for up in variant.unit_prices.filter(is_active=True):
-                try:
-                    val = Decimal(str(up.selling_price))
-                    if max_price is None or val > max_price:
-                        max_price = val
-                        # Get unit symbol from the unit price's unit
-                        unit_symbol = getattr(up.unit, 'symbol', 'pcs') if up.unit else 'pcs'
-                except Exception:
-                    continue
-        
-        # Fallback: if no unit prices found, try to get from available_units
-        if max_price is None:
-            max_price = Decimal('0')
-        
-        # Get image URL
+        # Get image URL (CloudinaryField still converts the raw value)
         image_url = None
-        if product.main_image:
-            image_url = product.main_image.url
+        if row['main_image']:
+            image_url = row['main_image'].url
         
         return {
-            'id': str(product.id),
-            'name': product.name,
-            'description': product.description[:100] if product.description else '',
-            'category_name': product.category.name if product.category else 'Other',
+            'id': str(row['id']),
+            'name': row['name'],
+            'description': row['description'][:100] if row['description'] else '',
+            'category_name': row['category__name'] or 'Other',
             'image_url': image_url,
             'main_image_url': image_url,
-            'display_price': float(max_price),
-            'display_unit': unit_symbol,
-            'is_active': product.is_active,
+            'display_price': float(row['cached_max_price'] or 0),
+            'display_unit': row['cached_unit_symbol'] or 'pcs',
+            'is_active': row['is_active'],
         }
     
     @action(detail=False, methods=['get'])
@@ -1061,12 +949,26 @@ class ProductTemplateViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        products = ProductTemplate.objects.filter(
-            Q(name__icontains=query) | Q(search_keywords__icontains=query),
-            is_active=True,
-            is_verified=True
-        )
+        products = ProductTemplate.objects.filter(is_active=True, is_verified=True)
+        # Prefix match every word, e.g. "red tom" -> "red:* & tom:*"
+        terms = re.findall(r'\w+', query)
+        
+        if connection.vendor == 'postgresql' and terms:
+            search_query = SearchQuery(
+                ' & '.join(f'{term}:*' for term in terms),
+                config='simple',
+                search_type='raw'
+            )
+            products = products.filter(search_vector=search_query).annotate(
+                rank=SearchRank(F('search_vector'), search_query)
+            ).order_by('-rank', 'name')
+        else:
+            products = products.filter(
+                Q(name__icontains=query) | Q(search_keywords__icontains=query)
+            )
         
+        # Not cursor paginated: cursor pages are keyed on name and would
+        # drop the rank order, and a float rank is no stable cursor key
         serializer = self.get_serializer(products, many=True)
         return Response(serializer.data)
     
@@ -1074,7 +976,19 @@ class ProductTemplateViewSet(viewsets.ReadOnlyModelViewSet):
     def variants(self, request, pk=None):
         """Get all variants of a product from different vendors"""
         product = self.get_object()
-        variants = product.variants.filter(is_active=True, is_approved=True)
+        variants = product.variants.filter(
+            is_active=True,
+            is_approved=True
+        ).select_related(
+            'vendor__user', 'market_zone', 'product_template__category'
+        ).prefetch_related(
+            Prefetch('unit_prices', queryset=UnitPrice.objects.select_related('unit')),
+            Prefetch(
+                'available_addons',
+                queryset=ProductAddonMapping.objects.filter(is_active=True).select_related('addon'),
+                to_attr='active_addon_mappings'
+            )
+        )
         serializer = ProductVariantDetailSerializer(variants, many=True)
         return Response(serializer.data)
 
@@ -1094,31 +1008,40 @@ class CartViewSet(viewsets.ViewSet):
     """Shopping cart management - per market"""
     permission_classes = [IsAuthenticated]
     
-    def get_cart(self, market_id):
-        """Get or create cart for market"""
-        cart, _ = Cart.objects.get_or_create(
-            customer=self.request.user,
-            market_id=market_id
-        )
-        return cart
-    
     @action(detail=False, methods=['get'])
     def list_carts(self, request):
         """Get all user's carts (one per market)"""
-        carts = Cart.objects.filter(customer=request.user).prefetch_related('items')
+        carts = Cart.objects.filter(customer=request.user).select_related(
+            'market', 'delivery_address__delivery_zone'
+        ).prefetch_related(
+            'items__product_variant__product_template',
+            'items__product_variant__vendor',
+            'items__measurement_unit',
+            'items__selected_addons',
+        )
         serializer = CartSerializer(carts, many=True)
         return Response(serializer.data)
     
     def _get_or_create_cart(self, user, market_id):
-        """Helper method to get or create a cart for a specific market"""
-        try:
-            market = Market.objects.get(id=market_id)
-        except Market.DoesNotExist:
+        """
+        Helper method to get or create a cart for a specific market.
+        Returns None if the market does not exist.
+        """
+        market_id = _parse_uuid(market_id)
+        if market_id is None:
+            return None
+        
+        # Existing cart: a single query, no market lookup
+        cart = Cart.objects.filter(customer=user, market_id=market_id).first()
+        if cart is not None:
+            return cart
+        
+        if not Market.objects.filter(id=market_id).exists():
             return None
         
         cart, created = Cart.objects.get_or_create(
             customer=user,
-            market=market
+            market_id=market_id
         )
         return cart
     
@@ -1170,23 +1093,9 @@ class CartViewSet(viewsets.ViewSet):
             )
         
         try:
-            # Get or create cart with transaction safety
-            with transaction.atomic():
-                try:
-                    cart = self._get_or_create_cart(request.user, market_id)
-                except IntegrityError as e:
-                    logger.warning(f"IntegrityError creating cart for user {request.user.id}: {e}")
-                    # Try to get existing cart if creation failed
-                    from markets.models import Market
-                    try:
-                        market = Market.objects.get(id=market_id)
-                        cart = Cart.objects.get(customer=request.user, market=market)
-                    except (Market.DoesNotExist, Cart.DoesNotExist):
-                        return Response(
-                            {'error': 'Failed to create or retrieve cart. Please try again.'},
-                            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-                        )
-            
+            # get_or_create resolves concurrent creation against the
+            # (customer, market) unique constraint on its own
+            cart = self._get_or_create_cart(request.user, market_id)
             if not cart:
                 return Response(
                     {'error': 'Market not found'},
@@ -1208,10 +1117,7 @@ class CartViewSet(viewsets.ViewSet):
                 )
             
             # Get measurement unit
-            unit = MeasurementUnit.objects.get(
-                id=serializer.validated_data['unit_id'],
-                is_active=True
-            )
+            unit = MeasurementUnit.get_active(serializer.validated_data['unit_id'])
             
             # Get addons if provided
             addons = None
@@ -1361,8 +1267,14 @@ class CartViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        cart = self._get_or_create_cart(request.user, market_id)
+        if not cart:
+            return Response(
+                {'error': 'Market not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
         try:
-            cart = self.get_cart(market_id)
             address = CustomerAddress.objects.get(
                 id=address_id,
                 customer=request.user.customer
@@ -1400,12 +1312,12 @@ class CartViewSet(viewsets.ViewSet):
                 
                 return Response({
                     'message': 'Market cart cleared and removed successfully',
-                    'remaining_carts': len(Cart.objects.filter(customer=request.user))
+                    'remaining_carts': Cart.objects.filter(customer=request.user).count()
                 })
             except Cart.DoesNotExist:
                 return Response({
                     'message': 'Cart not found (already empty)',
-                    'remaining_carts': len(Cart.objects.filter(customer=request.user))
+                    'remaining_carts': Cart.objects.filter(customer=request.user).count()
                 })
         except Exception as e:
             logger.exception(f"Error clearing market cart: {e}")
@@ -1419,9 +1331,9 @@ class CartViewSet(viewsets.ViewSet):
         """Clear all carts across all markets for the authenticated user"""
         try:
             with transaction.atomic():
-                carts = Cart.objects.filter(customer=request.user)
-                cart_count = carts.count()
-                carts.delete()
+                # delete() counts cascaded items too, so take the Cart count
+                _, deleted = Cart.objects.filter(customer=request.user).delete()
+                cart_count = deleted.get(Cart._meta.label, 0)
                 
                 return Response({
                     'message': f'All {cart_count} market carts cleared successfully',
@@ -1467,40 +1379,24 @@ class CustomerAddressViewSet(viewsets.ModelViewSet):
                 customer_lat = None
                 customer_lng = None
 
-            markets = Market.objects.filter(is_active=True, geo_location__isnull=False)
-            if markets.exists() and customer_lat is not None and customer_lng is not None:
-                from math import radians, sin, cos, sqrt, atan2
-
+            markets = list(_with_coordinates(
+                Market.objects.filter(is_active=True, geo_location__isnull=False)
+            )) if customer_lat is not None and customer_lng is not None else []
+            if markets:
                 config = DeliveryFeeConfig.get_active_config()
                 max_distance = float(config.max_delivery_distance) if config else 50.0
-                order_total = Decimal('0')
-
-                def haversine(lat1, lng1, lat2, lng2):
-                    R = 6371
-                    lat1, lng1, lat2, lng2 = map(radians, [lat1, lng1, lat2, lng2])
-                    dlat = lat2 - lat1
-                    dlng = lng2 - lng1
-                    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
-                    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-                    return R * c
+                method = calculation_method(config)
+                order_total = 0.0
 
                 best_market = None
                 lowest_fee = float('inf')
 
                 for m in markets:
-                    market_lat = float(m.geo_location.y)
-                    market_lng = float(m.geo_location.x)
-                    distance_km = haversine(customer_lat, customer_lng, market_lat, market_lng)
+                    distance_km = measure_km(customer_lat, customer_lng, m.lat, m.lng, method)
                     if distance_km > max_distance:
                         continue
 
-                    fee = None
-                    if order_total >= (config.free_delivery_threshold if config else 50000):
-                        fee = 0.0
-                    else:
-                        base_fee = float(config.base_fee) if config else 1000
-                        km_rate = float(config.per_km_rate) if config else 500
-                        fee = base_fee + (distance_km * km_rate)
+                    fee, _, _ = compute_zone_fee(None, config, distance_km, order_total)
 
                     if fee < lowest_fee:
                         lowest_fee = fee
@@ -1543,6 +1439,24 @@ class CustomerAddressViewSet(viewsets.ModelViewSet):
 # ORDER VIEWSET
 # ============================================
 
+def _order_detail_queryset():
+    """Orders with everything OrderDetailSerializer walks loaded up front"""
+    return Order.objects.select_related(
+        'customer__customer',
+        'delivery_address__delivery_zone__market',
+        'driver__driver',
+    ).prefetch_related(
+        Prefetch(
+            'items',
+            queryset=OrderItem.objects.select_related(
+                'product_variant__product_template',
+                'product_variant__vendor__user',
+                'measurement_unit',
+            ).prefetch_related('selected_addons')
+        )
+    )
+
+
 class OrderViewSet(viewsets.ViewSet):
     """Order management"""
     permission_classes = [IsAuthenticated]
@@ -1551,34 +1465,76 @@ class OrderViewSet(viewsets.ViewSet):
         """Get customer's orders"""
         orders = Order.objects.filter(
             customer=request.user
-        ).prefetch_related('items').order_by('-created_at')
+        ).annotate(items_count=Count('items')).order_by('-created_at')
         
         serializer = OrderListSerializer(orders, many=True)
         return Response(serializer.data)
     
     def retrieve(self, request, pk=None):
         """Get order details"""
-        try:
-            order = Order.objects.get(id=pk, customer=request.user)
-            serializer = OrderDetailSerializer(order)
-            return Response(serializer.data)
-        except Order.DoesNotExist:
+        order = _order_detail_queryset().filter(
+            id=_parse_uuid(pk), customer=request.user
+        ).first()
+        if order is None:
+            return Response(
+                {'error': 'Order not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(OrderDetailSerializer(order).data)
+    
+    @action(detail=True, methods=['get'])
+    def driver_location(self, request, pk=None):
+        """
+        Latest driver position for live tracking of the customer's order
+        
+        Endpoint: GET /api/v1/orders/{order_id}/driver_location/
+        driver_location is null until the driver's app reports a position
+        """
+        order = Order.objects.only('id').filter(
+            id=_parse_uuid(pk), customer=request.user
+        ).first()
+        if order is None:
             return Response(
                 {'error': 'Order not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        from .driver_order_helpers import get_driver_location
+        return Response({
+            'order_id': str(order.id),
+            'driver_location': get_driver_location(order)
+        })
+    
+    def _idempotent_replay(self, user, idempotency_key):
+        """Response for an order already created with this Idempotency-Key, or None"""
+        order = _order_detail_queryset().filter(
+            customer=user,
+            idempotency_key=idempotency_key
+        ).first()
+        if order is None:
+            return None
+        logger.info('[CreateOrder] Replaying order %s for idempotency key %s', order.order_number, idempotency_key)
+        return Response({
+            'message': 'Order created successfully',
+            'order': OrderDetailSerializer(order).data
+        }, status=status.HTTP_201_CREATED)
     
     @action(detail=False, methods=['post'])
     def create_order(self, request):
         """Create order from cart with validation"""
-        logger.info(f'[CreateOrder] ===== NEW ORDER REQUEST =====')
-        logger.info(f'[CreateOrder] Raw request.data: {dict(request.data)}')
+        # A retried submit with the same Idempotency-Key gets the original order back
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip()[:128] or None
+        if idempotency_key:
+            replay = self._idempotent_replay(request.user, idempotency_key)
+            if replay is not None:
+                return replay
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('[CreateOrder] Raw request.data: %s', dict(request.data))
         
         serializer = OrderCreateSerializer(data=request.data)
-        is_valid = serializer.is_valid()
-        logger.info(f'[CreateOrder] Serializer valid: {is_valid}')
-        if not is_valid:
-            logger.error(f'[CreateOrder] Validation errors: {serializer.errors}')
+        if not serializer.is_valid():
+            logger.error('[CreateOrder] Validation errors: %s', serializer.errors)
         serializer.is_valid(raise_exception=True)
         
         try:
@@ -1588,23 +1544,18 @@ class OrderViewSet(viewsets.ViewSet):
                 customer_lat = serializer.validated_data['customer_latitude']
                 customer_lon = serializer.validated_data['customer_longitude']
                 raw_fee = serializer.validated_data.get('delivery_fee')
-                logger.info(f'[CreateOrder] Raw delivery_fee from serializer: {raw_fee} (type: {type(raw_fee).__name__})')
                 
                 delivery_fee = validate_and_normalize_delivery_fee(raw_fee)
-                logger.info(f'[CreateOrder] After normalization: {delivery_fee} (type: {type(delivery_fee).__name__})')
                 
                 # Get location name from request (from Flutter app)
                 delivery_location_name = serializer.validated_data.get('delivery_location_name', 'Delivery Location')
-                logger.info(f'[CreateOrder] Delivery location name from app: {delivery_location_name}')
                 
                 payment_method = serializer.validated_data['payment_method']
                 
-                logger.info(f'[CreateOrder] ===== ORDER PARAMETERS =====')
-                logger.info(f'[CreateOrder] Market: {market_id}')
-                logger.info(f'[CreateOrder] Latitude: {customer_lat}')
-                logger.info(f'[CreateOrder] Longitude: {customer_lon}')
-                logger.info(f'[CreateOrder] Delivery Fee: {delivery_fee}')
-                logger.info(f'[CreateOrder] Payment: {payment_method}')
+                logger.debug(
+                    '[CreateOrder] market=%s lat=%s lng=%s delivery_fee=%s (raw %r) payment=%s location=%s',
+                    market_id, customer_lat, customer_lon, delivery_fee, raw_fee, payment_method, delivery_location_name
+                )
                 
                 # Get cart
                 try:
@@ -1618,7 +1569,17 @@ class OrderViewSet(viewsets.ViewSet):
                         status=status.HTTP_404_NOT_FOUND
                     )
                 
-                if not cart.items.exists():
+                # Load the cart items once for both the totals and the copy below
+                # Only FK ids are copied, so the variant/unit rows are not joined
+                cart_items = list(
+                    cart.items.only(
+                        'id', 'product_variant', 'measurement_unit', 'quantity',
+                        'unit_price', 'addons_total', 'special_instructions'
+                    ).prefetch_related(
+                        Prefetch('selected_addons', queryset=ProductAddon.objects.only('id'))
+                    )
+                )
+                if not cart_items:
                     return Response(
                         {'error': 'Cart is empty'},
                         status=status.HTTP_400_BAD_REQUEST
@@ -1632,10 +1593,10 @@ class OrderViewSet(viewsets.ViewSet):
                         id=delivery_address_id,
                         customer=request.user
                     )
-                    logger.info(f'[CreateOrder] Using existing delivery address: {delivery_address_id}')
+                    logger.debug('[CreateOrder] Using existing delivery address: %s', delivery_address_id)
                 except CustomerAddress.DoesNotExist:
                     # Address doesn't exist - create a temporary one from coordinates
-                    logger.info(f"[CreateOrder] Creating temporary delivery address for coordinates ({customer_lat}, {customer_lon})")
+                    logger.debug('[CreateOrder] Creating temporary delivery address for (%s, %s)', customer_lat, customer_lon)
                     
                     # Get market for the address
                     try:
@@ -1646,34 +1607,8 @@ class OrderViewSet(viewsets.ViewSet):
                             status=status.HTTP_404_NOT_FOUND
                         )
                     
-                    # Create temporary address
-                    from django.contrib.gis.geos import Point
-                    location_point = Point(float(customer_lon), float(customer_lat))
-                    
-                    # Find delivery zone for this location
-                    delivery_zone = None
-                    try:
-                        from django.contrib.gis.db.models.functions import Distance
-                        # Find zones that contain this point or are closest
-                        delivery_zones = DeliveryZone.objects.filter(
-                            market_id=market_id
-                        ).annotate(
-                            distance=Distance('coverage_area', location_point)
-                        ).order_by('distance')
-                        
-                        if delivery_zones.exists():
-                            # Check if point is within any zone
-                            for zone in delivery_zones:
-                                if zone.coverage_area and zone.coverage_area.contains(location_point):
-                                    delivery_zone = zone
-                                    break
-                            # If not in any zone, use closest
-                            if not delivery_zone:
-                                delivery_zone = delivery_zones.first()
-                    except Exception as e:
-                        logger.warning(f"Could not determine delivery zone: {e}")
-                    
-                    # Create the temporary address
+                    # Create the temporary address; save() builds the point and
+                    # detects the delivery zone from the coordinates
                     delivery_address = CustomerAddress.objects.create(
                         id=delivery_address_id,
                         customer=request.user,
@@ -1681,52 +1616,34 @@ class OrderViewSet(viewsets.ViewSet):
                         label=delivery_location_name,
                         street_address="Location from app",
                         latitude=customer_lat,
-                        longitude=customer_lon,
-                        location_point=location_point,
-                        delivery_zone=delivery_zone
+                        longitude=customer_lon
                     )
-                    logger.info(f"[CreateOrder] Temporary address created with name '{delivery_location_name}': {delivery_address.id}")
+                    logger.debug('[CreateOrder] Temporary address %s created as %r', delivery_address.id, delivery_location_name)
                 
                 # Stock validation removed - ProductVariant no longer has stock field
                 # Orders can be placed freely, stock management happens at vendor level
                 
-                # Calculate items total from cart
-                items_total = Decimal('0.00')
-                logger.info(f'[CreateOrder] ===== CALCULATING ITEMS TOTAL =====')
-                for cart_item in cart.items.all():
-                    item_subtotal = cart_item.quantity * cart_item.unit_price + cart_item.addons_total
-                    logger.info(f'[CreateOrder] Cart item: qty={cart_item.quantity}, unit_price={cart_item.unit_price}, addons={cart_item.addons_total}, subtotal={item_subtotal}')
-                    items_total += item_subtotal
+                # Line totals are computed once and reused for OrderItem.total_price below
+                line_totals = [
+                    cart_item.unit_price * cart_item.quantity + cart_item.addons_total
+                    for cart_item in cart_items
+                ]
+                items_total = sum(line_totals, Decimal('0.00'))
                 
-                logger.info(f'[CreateOrder] Final items_total: {items_total} (type: {type(items_total).__name__})')
+                logger.debug('[CreateOrder] items_total=%s over %d cart item(s)', items_total, len(cart_items))
                 
                 # Use the delivery fee from app (already validated)
                 # DO NOT recalculate - trust the app's calculation
-                logger.info(f'[CreateOrder] ===== USING DELIVERY FEE =====')
-                logger.info(f'[CreateOrder] Using delivery_fee from app: {delivery_fee} (type: {type(delivery_fee).__name__})')
                 
                 # Calculate order totals using helper function
-                logger.info(f'[CreateOrder] ===== CALLING CALCULATE_ORDER_TOTALS HELPER =====')
                 totals = calculate_order_totals(
                     items_total=items_total,
                     delivery_fee=delivery_fee,
                     service_fee=Decimal('0.00'),
                     discount_amount=Decimal('0.00')
                 )
-                logger.info(f'[CreateOrder] ===== TOTALS FROM HELPER =====')
-                logger.info(f'[CreateOrder] items_total: {totals["items_total"]}')
-                logger.info(f'[CreateOrder] delivery_fee: {totals["delivery_fee"]}')
-                logger.info(f'[CreateOrder] service_fee: {totals["service_fee"]}')
-                logger.info(f'[CreateOrder] total_amount: {totals["total_amount"]}')
                 
                 # Create order with complete delivery location details for driver tracking
-                logger.info(f'[CreateOrder] ===== CREATING ORDER OBJECT =====')
-                logger.info(f'[CreateOrder] About to save Order with:')
-                logger.info(f'  items_total: {totals["items_total"]}')
-                logger.info(f'  delivery_fee: {totals["delivery_fee"]}')
-                logger.info(f'  service_fee: {totals["service_fee"]}')
-                logger.info(f'  total_amount: {totals["total_amount"]}')
-                
                 order = Order.objects.create(
                     customer=request.user,
                     delivery_address=delivery_address,
@@ -1742,41 +1659,59 @@ class OrderViewSet(viewsets.ViewSet):
                     payment_method=payment_method,
                     status='pending',
                     scheduled_delivery_date=timezone.now().date(),
-                    scheduled_delivery_time='TBD'
+                    scheduled_delivery_time='TBD',
+                    idempotency_key=idempotency_key
                 )
-                logger.info(f'[CreateOrder] ===== ORDER CREATED =====')
-                logger.info(f'[CreateOrder] Order ID: {order.id}')
-                logger.info(f'[CreateOrder] Order Number: {order.order_number}')
-                logger.info(f'[CreateOrder] Saved in DB - items_total: {order.items_total}')
-                logger.info(f'[CreateOrder] Saved in DB - delivery_fee: {order.delivery_fee}')
-                logger.info(f'[CreateOrder] Saved in DB - total_amount: {order.total_amount}')
                 
-                # Copy cart items to order items
-                for cart_item in cart.items.all():
-                    order_item = OrderItem.objects.create(
+                # Copy cart items to order items in one INSERT each for items and addons.
+                # bulk_create skips OrderItem.save(), so total_price is set here.
+                order_items = OrderItem.objects.bulk_create([
+                    OrderItem(
                         order=order,
-                        product_variant=cart_item.product_variant,
-                        measurement_unit=cart_item.measurement_unit,
+                        product_variant_id=cart_item.product_variant_id,
+                        measurement_unit_id=cart_item.measurement_unit_id,
                         quantity=cart_item.quantity,
                         unit_price=cart_item.unit_price,
                         addons_total=cart_item.addons_total,
+                        total_price=line_total,
                         special_instructions=cart_item.special_instructions
                     )
-                    order_item.selected_addons.set(cart_item.selected_addons.all())
+                    for cart_item, line_total in zip(cart_items, line_totals)
+                ])
+                AddonLink = OrderItem.selected_addons.through
+                AddonLink.objects.bulk_create([
+                    AddonLink(orderitem_id=order_item.id, productaddon_id=addon.id)
+                    for order_item, cart_item in zip(order_items, cart_items)
+                    for addon in cart_item.selected_addons.all()
+                ])
                 
                 # Clear cart after order creation
                 cart.delete()
                 
-                logger.info(f"[CreateOrder] Order {order.order_number} created successfully")
-                logger.info(f"[CreateOrder] Order totals - Items: {totals['items_total']}, Delivery: {totals['delivery_fee']}, Total: {totals['total_amount']}")
+                logger.info(
+                    '[CreateOrder] Order %s created - items: %s, delivery: %s, total: %s',
+                    order.order_number, totals['items_total'], totals['delivery_fee'], totals['total_amount']
+                )
                 
+                # Reload with the detail prefetches so serializing doesn't query per item
+                order = _order_detail_queryset().get(pk=order.pk)
                 return Response({
                     'message': 'Order created successfully',
                     'order': OrderDetailSerializer(order).data
                 }, status=status.HTTP_201_CREATED)
         
+        except IntegrityError as e:
+            # A concurrent submit with the same key committed first
+            replay = self._idempotent_replay(request.user, idempotency_key) if idempotency_key else None
+            if replay is not None:
+                return replay
+            logger.exception('Error creating order: %s', e)
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
         except Exception as e:
-            logger.exception(f"Error creating order: {e}")
+            logger.exception('Error creating order: %s', e)
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -1785,30 +1720,31 @@ class OrderViewSet(viewsets.ViewSet):
     @action(detail=True, methods=['post'])
     def cancel_order(self, request, pk=None):
         """Cancel order (before confirmation)"""
-        try:
-            order = Order.objects.get(id=pk, customer=request.user)
-            
-            if order.status not in ['pending', 'confirmed']:
+        orders = Order.objects.filter(id=_parse_uuid(pk), customer=request.user)
+
+        # Conditional UPDATE so a concurrent status change can't be overwritten
+        cancelled = orders.filter(status__in=['pending', 'confirmed']).update(
+            status='cancelled',
+            cancellation_reason=request.data.get('reason', ''),
+            cancelled_at=timezone.now(),
+        )
+        if not cancelled:
+            if not orders.exists():
                 return Response(
-                    {'error': 'Only pending or confirmed orders can be cancelled'},
-                    status=status.HTTP_400_BAD_REQUEST
+                    {'error': 'Order not found'},
+                    status=status.HTTP_404_NOT_FOUND
                 )
-            
-            order.status = 'cancelled'
-            order.cancellation_reason = request.data.get('reason', '')
-            order.cancelled_at = timezone.now()
-            order.save()
-            
-            return Response({
-                'message': 'Order cancelled',
-                'order': OrderDetailSerializer(order).data
-            })
-        except Order.DoesNotExist:
             return Response(
-                {'error': 'Order not found'},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': 'Only pending or confirmed orders can be cancelled'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
+        order = _order_detail_queryset().get(pk=pk)
+        return Response({
+            'message': 'Order cancelled',
+            'order': OrderDetailSerializer(order).data
+        })
+
 
 # ============================================
 # DRIVER AUTHENTICATION & PROFILE
@@ -1843,7 +1779,9 @@ class DriverLoginView(generics.GenericAPIView):
             )
         
         try:
-            user = User.objects.get(phone_number=phone_number, user_type='driver')
+            user = User.objects.select_related('driver').get(
+                phone_number=phone_number, user_type='driver'
+            )
             driver = user.driver
             
             # Check if driver is approved
@@ -1869,10 +1807,11 @@ class DriverLoginView(generics.GenericAPIView):
             # Generate OTP
             otp = OTPService.generate_otp()
             
-            # Store OTP in session (with expiry handled by Django session timeout)
-            request.session['driver_otp'] = otp
-            request.session['driver_phone'] = phone_number
-            request.session['driver_email'] = user.email
+            # Store OTP in the shared cache; it expires on its own after OTP_EXPIRY_MINUTES
+            cache.set_many({
+                DRIVER_OTP_CACHE_KEY.format(phone_number): {'otp': otp, 'email': user.email},
+                DRIVER_OTP_ATTEMPTS_CACHE_KEY.format(phone_number): 0,
+            }, timeout=settings.OTP_EXPIRY_MINUTES * 60)
             
             # Send OTP via email
             email_sent = OTPService.send_driver_otp_email(
@@ -1936,37 +1875,42 @@ class DriverVerifyOTPView(generics.GenericAPIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Verify OTP from session
-        session_otp = request.session.get('driver_otp')
-        session_phone = request.session.get('driver_phone')
+        # Verify OTP issued for this phone number
+        cache_key = DRIVER_OTP_CACHE_KEY.format(phone_number)
+        attempts_key = DRIVER_OTP_ATTEMPTS_CACHE_KEY.format(phone_number)
+        pending = cache.get(cache_key)
         
-        if not session_otp or session_otp != otp:
+        # Every guess takes an attempt up front with an incr on the shared
+        # cache, so concurrent guesses on any worker count against one limit
+        try:
+            attempts = cache.incr(attempts_key) if pending else None
+        except ValueError:
+            attempts = None
+        
+        if (
+            attempts is None
+            or attempts > settings.OTP_MAX_ATTEMPTS
+            or not hmac.compare_digest(str(pending['otp']).encode(), str(otp).encode())
+        ):
+            if attempts is not None and attempts >= settings.OTP_MAX_ATTEMPTS:
+                # Limit reached; the code cannot be guessed any further
+                cache.delete_many([cache_key, attempts_key])
             return Response(
                 {'error': 'Invalid or expired OTP. Please request a new code.'},
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
-        if session_phone != phone_number:
-            return Response(
-                {'error': 'Phone number mismatch. Please use the same phone number.'},
-                status=status.HTTP_401_UNAUTHORIZED
-            )
-        
         try:
             user = User.objects.get(phone_number=phone_number, user_type='driver')
             
             # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
+            tokens = _token_pair(user)
             
-            # Clear session OTP data
-            session_keys_to_delete = ['driver_otp', 'driver_phone', 'driver_email']
-            for key in session_keys_to_delete:
-                if key in request.session:
-                    del request.session[key]
+            # OTP is single use
+            cache.delete_many([cache_key, attempts_key])
             
             return Response({
-                'access': str(refresh.access_token),
-                'refresh': str(refresh),
+                **tokens,
                 'driver_id': str(user.id),
                 'phone_number': user.phone_number,
                 'email': user.email,
@@ -2059,10 +2003,13 @@ class DriverUpdateLocationView(generics.GenericAPIView):
         
         try:
             driver = request.user.driver
-            driver.is_available = is_online
-            driver.save()
+            # Heartbeats arrive every few seconds; only write when availability flips
+            if driver.is_available != is_online:
+                driver.is_available = is_online
+                driver.save(update_fields=['is_available'])
             
-            # TODO: Update location in Redis/Cache for real-time tracking
+            # Order tracking positions are recorded per order through
+            # DriverOrderViewSet.update_location
             
             return Response({
                 'message': 'Location updated',
@@ -2092,26 +2039,17 @@ class DriverStatsView(generics.GenericAPIView):
         try:
             driver = request.user.driver
             
-            # Get statistics
-            total_deliveries = Order.objects.filter(
-                driver=request.user,
-                status='delivered'
-            ).count()
-            
-            pending_deliveries = Order.objects.filter(
-                driver=request.user,
-                status__in=['assigned', 'picked_up', 'on_the_way']
-            ).count()
-            
-            failed_deliveries = Order.objects.filter(
-                driver=request.user,
-                status='failed'
-            ).count()
+            # Get statistics in a single conditional aggregate
+            stats = Order.objects.filter(driver=request.user).aggregate(
+                total_deliveries=Count('id', filter=Q(status='delivered')),
+                pending_deliveries=Count('id', filter=Q(status__in=['assigned', 'picked_up', 'on_the_way'])),
+                failed_deliveries=Count('id', filter=Q(status='failed')),
+            )
             
             return Response({
-                'total_deliveries': total_deliveries,
-                'pending_deliveries': pending_deliveries,
-                'failed_deliveries': failed_deliveries,
+                'total_deliveries': stats['total_deliveries'],
+                'pending_deliveries': stats['pending_deliveries'],
+                'failed_deliveries': stats['failed_deliveries'],
                 'is_available': driver.is_available,
                 'is_verified': driver.is_verified
             })
@@ -2131,12 +2069,55 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Order.objects.all()
     serializer_class = DriverOrderDetailSerializer
+    pagination_class = OptionalOrderCursorPagination
+    
+    # Unassigned orders in these statuses can be claimed by a driver
+    AVAILABLE_STATUSES = ['confirmed', 'preparing', 'ready']
+    
+    def get_queryset(self):
+        """Orders with everything the driver serializers walk loaded up front"""
+        return Order.objects.select_related(
+            'customer__customer',
+            'delivery_address',
+        ).prefetch_related(
+            Prefetch(
+                'items',
+                queryset=OrderItem.objects.select_related(
+                    'product_variant__product_template',
+                    'product_variant__vendor',
+                    'product_variant__market_zone__market',
+                    'measurement_unit',
+                ).prefetch_related('selected_addons').order_by('created_at')
+            )
+        )
+    
+    def get_list_queryset(self):
+        """Orders for the list cards, loading only the item columns the cards read"""
+        return Order.objects.select_related(
+            'customer__customer',
+            'delivery_address',
+        ).prefetch_related(
+            Prefetch(
+                'items',
+                queryset=OrderItem.objects.select_related(
+                    'product_variant__vendor',
+                    'product_variant__market_zone__market',
+                ).only(
+                    'id', 'order', 'quantity', 'total_price', 'created_at',
+                    'product_variant__vendor__id',
+                    'product_variant__market_zone__name',
+                    'product_variant__market_zone__market__name',
+                    'product_variant__market_zone__market__latitude',
+                    'product_variant__market_zone__market__longitude',
+                    'product_variant__market_zone__market__address',
+                    'product_variant__market_zone__market__location',
+                ).order_by('created_at')
+            )
+        )
     
     def check_driver_permission(self, request):
-        """Verify user is a driver"""
-        if not hasattr(request.user, 'driver'):
-            return False
-        return True
+        """Verify user has an approved driver profile, in one EXISTS query"""
+        return Driver.objects.filter(user=request.user, is_approved='approved').exists()
     
     @action(detail=False, methods=['get'])
     def my_orders(self, request):
@@ -2148,10 +2129,14 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
             )
         
         # Get pending and in-progress orders
-        orders = Order.objects.filter(
+        orders = self.get_list_queryset().filter(
             driver=request.user,
             status__in=['assigned', 'picked_up', 'on_the_way']
-        ).prefetch_related('items').order_by('-assigned_at')
+        ).order_by('-assigned_at')
+        
+        page = self.paginate_queryset(orders)
+        if page is not None:
+            return self.get_paginated_response(DriverOrderListSerializer(page, many=True).data)
         
         serializer = DriverOrderListSerializer(orders, many=True)
         return Response(serializer.data)
@@ -2166,10 +2151,14 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
             )
         
         # Get orders ready for pickup (not yet assigned)
-        orders = Order.objects.filter(
-            status__in=['confirmed', 'preparing', 'ready'],
+        orders = self.get_list_queryset().filter(
+            status__in=self.AVAILABLE_STATUSES,
             driver__isnull=True
-        ).prefetch_related('items').order_by('-created_at')
+        ).order_by('-created_at')
+        
+        page = self.paginate_queryset(orders)
+        if page is not None:
+            return self.get_paginated_response(DriverOrderListSerializer(page, many=True).data)
         
         serializer = DriverOrderListSerializer(orders, many=True)
         return Response(serializer.data)
@@ -2183,7 +2172,7 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
             )
         
         try:
-            order = Order.objects.get(
+            order = self.get_queryset().get(
                 id=pk,
                 driver=request.user
             )
@@ -2210,7 +2199,7 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
         
         try:
             # Allow preview for orders that are available to drivers (confirmed, preparing, ready)
-            order = Order.objects.get(
+            order = self.get_queryset().get(
                 id=pk, 
                 status__in=['confirmed', 'preparing', 'ready'],
                 driver__isnull=True  # Not yet assigned to a driver
@@ -2232,29 +2221,41 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        try:
-            order = Order.objects.get(id=pk)
-            
-            if order.driver is not None:
+        order_id = _parse_uuid(pk)
+        
+        # Claim only if still unassigned and awaiting pickup, so two drivers
+        # can't both accept and cancelled/delivered orders can't be claimed
+        accepted = Order.objects.filter(
+            id=order_id,
+            driver__isnull=True,
+            status__in=self.AVAILABLE_STATUSES
+        ).update(
+            driver=request.user,
+            status='assigned',
+            assigned_at=timezone.now(),
+        )
+        if not accepted:
+            current = Order.objects.filter(id=order_id).values('driver_id').first()
+            if current is None:
+                return Response(
+                    {'error': 'Order not found'},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            if current['driver_id'] is not None:
                 return Response(
                     {'error': 'Order already assigned to another driver'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            
-            order.driver = request.user
-            order.status = 'assigned'
-            order.assigned_at = timezone.now()
-            order.save()
-            
-            return Response({
-                'message': 'Order accepted',
-                'order': DriverOrderDetailSerializer(order).data
-            })
-        except Order.DoesNotExist:
             return Response(
-                {'error': 'Order not found'},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': 'Order is not available for pickup'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        order = self.get_queryset().get(id=order_id)
+        return Response({
+            'message': 'Order accepted',
+            'order': DriverOrderDetailSerializer(order).data
+        })
     
     @action(detail=True, methods=['post'])
     def update_status(self, request, pk=None):
@@ -2279,26 +2280,24 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        try:
-            order = Order.objects.get(id=pk, driver=request.user)
-            order.status = new_status
-            
-            if new_status == 'delivered':
-                order.delivered_at = timezone.now()
-            elif new_status == 'failed':
-                order.cancellation_reason = request.data.get('reason', '')
-            
-            order.save()
-            
-            return Response({
-                'message': f'Order status updated to {new_status}',
-                'order': DriverOrderDetailSerializer(order).data
-            })
-        except Order.DoesNotExist:
+        changes = {'status': new_status}
+        if new_status == 'delivered':
+            changes['delivered_at'] = timezone.now()
+        elif new_status == 'failed':
+            changes['cancellation_reason'] = request.data.get('reason', '')
+        
+        order_id = _parse_uuid(pk)
+        if not Order.objects.filter(id=order_id, driver=request.user).update(**changes):
             return Response(
                 {'error': 'Order not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        order = self.get_queryset().get(id=order_id)
+        return Response({
+            'message': f'Order status updated to {new_status}',
+            'order': DriverOrderDetailSerializer(order).data
+        })
 
     @action(detail=True, methods=['post'])
     def update_item_checklist(self, request, pk=None):
@@ -2322,8 +2321,10 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
             # Update order status if provided
             if new_status and new_status in ['picked_up', 'on_the_way']:
                 order.status = new_status
-                order.save()
+                order.save(update_fields=['status'])
             
+            # Load items after the is_found updates so the response reflects them
+            order = self.get_queryset().get(pk=order.pk)
             return Response({
                 'message': 'Checklist updated successfully',
                 'order': DriverOrderDetailSerializer(order).data
@@ -2365,9 +2366,12 @@ class DriverOrderViewSet(viewsets.GenericViewSet):
         try:
             from .driver_order_helpers import record_driver_location
             
-            order = Order.objects.get(id=pk, driver=request.user)
+            # Ownership check only; the ping needs nothing but the order's id and number
+            order = Order.objects.only('id', 'order_number').get(
+                id=_parse_uuid(pk), driver=request.user
+            )
             
-            # Record location (will be expanded with proper tracking model)
+            # Record location in the shared cache
             result = record_driver_location(order, latitude, longitude)
             
             return Response({
@@ -2391,29 +2395,59 @@ class FavoritesViewSet(viewsets.ViewSet):
     """Favorite items management for logged-in customers"""
     permission_classes = [IsAuthenticated]
     
+    def check_customer_permission(self, request):
+        """Verify user is a customer; favorites are keyed by the user itself"""
+        return request.user.user_type == 'customer'
+    
+    def customer_not_found(self):
+        """404 response for users without a customer profile"""
+        return Response(
+            {'error': 'Customer profile not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
     @action(detail=False, methods=['get'])
     def list_favorites(self, request):
         """Get all favorites for current customer"""
-        try:
-            customer = Customer.objects.get(user=request.user)
-            favorites = FavoriteItem.objects.filter(customer=customer).select_related('product')
-            serializer = FavoriteItemSerializer(favorites, many=True)
-            
-            return Response({
-                'count': favorites.count(),
-                'favorites': serializer.data
-            })
-        except Customer.DoesNotExist:
-            return Response(
-                {'error': 'Customer profile not found'},
-                status=status.HTTP_404_NOT_FOUND
+        if not self.check_customer_permission(request):
+            return self.customer_not_found()
+        
+        # Cached per customer; dropped on favorite changes and any catalog change
+        cache_key = favorites_cache_key(request.user.id)
+        payload = cache.get(cache_key)
+        if payload is not None:
+            return Response(payload)
+        
+        favorites = list(
+            FavoriteItem.objects.filter(customer=request.user).select_related(
+                'product__category'
+            ).prefetch_related(
+                Prefetch(
+                    'product__variants',
+                    queryset=ProductVariant.objects.filter(
+                        is_active=True,
+                        is_approved=True
+                    ).select_related('vendor__user', 'market_zone').prefetch_related('unit_prices__unit'),
+                    to_attr='approved_variants'
+                )
             )
+        )
+        serializer = FavoriteItemSerializer(favorites, many=True)
+        
+        payload = {
+            'count': len(favorites),
+            'favorites': serializer.data
+        }
+        cache.set(cache_key, payload, FAVORITES_CACHE_TTL)
+        return Response(payload)
     
     @action(detail=False, methods=['post'])
     def add_favorite(self, request):
         """Add product to favorites"""
+        if not self.check_customer_permission(request):
+            return self.customer_not_found()
+        
         try:
-            customer = Customer.objects.get(user=request.user)
             product_id = request.data.get('product_id')
             
             if not product_id:
@@ -2424,14 +2458,16 @@ class FavoritesViewSet(viewsets.ViewSet):
             
             product = ProductTemplate.objects.get(id=product_id)
             
-            # Check if already favorited
+            # Check if already favorited; get_or_create re-reads the row if a
+            # concurrent add wins the unique constraint
             favorite, created = FavoriteItem.objects.get_or_create(
-                customer=customer,
+                customer=request.user,
                 product=product
             )
+            favorite.product = product
             
             if created:
-                logger.info(f"Customer {customer.id} added product {product.id} to favorites")
+                logger.info(f"Customer {request.user.id} added product {product.id} to favorites")
                 return Response({
                     'message': 'Product added to favorites',
                     'favorite': FavoriteItemSerializer(favorite).data
@@ -2442,11 +2478,6 @@ class FavoritesViewSet(viewsets.ViewSet):
                     'favorite': FavoriteItemSerializer(favorite).data
                 }, status=status.HTTP_200_OK)
         
-        except Customer.DoesNotExist:
-            return Response(
-                {'error': 'Customer profile not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
         except ProductTemplate.DoesNotExist:
             return Response(
                 {'error': 'Product not found'},
@@ -2456,65 +2487,57 @@ class FavoritesViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['delete'])
     def remove_favorite(self, request):
         """Remove product from favorites"""
+        if not self.check_customer_permission(request):
+            return self.customer_not_found()
+        
+        product_id = request.query_params.get('product_id')
+        
+        if not product_id:
+            return Response(
+                {'error': 'product_id query parameter required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
         try:
-            customer = Customer.objects.get(user=request.user)
-            product_id = request.query_params.get('product_id')
-            
-            if not product_id:
-                return Response(
-                    {'error': 'product_id query parameter required'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
             favorite = FavoriteItem.objects.get(
-                customer=customer,
+                customer=request.user,
                 product_id=product_id
             )
-            
-            favorite.delete()
-            logger.info(f"Customer {customer.id} removed product {product_id} from favorites")
-            
-            return Response({'message': 'Product removed from favorites'})
-        
-        except Customer.DoesNotExist:
-            return Response(
-                {'error': 'Customer profile not found'},
-                status=status.HTTP_404_NOT_FOUND
-            )
         except FavoriteItem.DoesNotExist:
             return Response(
                 {'error': 'Product not in favorites'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        
+        favorite.delete()
+        logger.info(f"Customer {request.user.id} removed product {product_id} from favorites")
+        
+        return Response({'message': 'Product removed from favorites'})
     
     @action(detail=False, methods=['post'])
     def is_favorite(self, request):
         """Check if product is in favorites"""
-        try:
-            customer = Customer.objects.get(user=request.user)
-            product_id = request.data.get('product_id')
-            
-            if not product_id:
-                return Response(
-                    {'error': 'product_id field required'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            is_favorited = FavoriteItem.objects.filter(
-                customer=customer,
-                product_id=product_id
-            ).exists()
-            
-            return Response({
-                'product_id': product_id,
-                'is_favorite': is_favorited
-            })
+        if not self.check_customer_permission(request):
+            return self.customer_not_found()
+        
+        product_id = request.data.get('product_id')
         
-        except Customer.DoesNotExist:
+        if not product_id:
             return Response(
-                {'error': 'Customer profile not found'},
-                status=status.HTTP_404_NOT_FOUND
+                {'error': 'product_id field required'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        
+        # Served by the (customer, product) unique index; malformed ids never match
+        is_favorited = FavoriteItem.objects.filter(
+            customer_id=request.user.id,
+            product_id=_parse_uuid(product_id)
+        ).exists()
+        
+        return Response({
+            'product_id': product_id,
+            'is_favorite': is_favorited
+        })
 
 
 class DriverRegistrationView(generics.GenericAPIView):
@@ -2585,9 +2608,16 @@ class DriverDetailsView(generics.RetrieveAPIView):
             raise Http404("Driver profile not found")
     
     def retrieve(self, request, *args, **kwargs):
-        driver = self.get_object()
-        
-        return Response({
+        cache_key = DRIVER_DETAILS_CACHE_KEY.format(request.user.id)
+        payload = cache.get(cache_key)
+        if payload is None:
+            payload = self._details_payload(self.get_object())
+            cache.set(cache_key, payload, DRIVER_DETAILS_CACHE_TTL)
+        return Response(payload, status=status.HTTP_200_OK)
+    
+    def _details_payload(self, driver):
+        """Response body for a driver profile"""
+        return {
             'driver_id': str(driver.user.id),
             'phone_number': driver.user.phone_number,
             'email': driver.user.email,
@@ -2602,7 +2632,7 @@ class DriverDetailsView(generics.RetrieveAPIView):
             'rejection_reason': driver.rejection_reason,
             'approved_at': driver.approved_at,
             'created_at': driver.created_at
-        }, status=status.HTTP_200_OK)
+        }
 
 
 # ============================================
@@ -3002,7 +3032,7 @@ class ClickPesaWebhookView(APIView):
                 order.payment_reference = transaction_id
                 if not order.confirmed_at:
                     order.confirmed_at = timezone.now()
-                order.save()
+                order.save(update_fields=['is_paid', 'status', 'payment_reference', 'confirmed_at'])
                 
                 logger.info(f"[ClickPesaWebhook] Order {order_reference} marked as PAID and CONFIRMED")
             elif payment_status == 'FAILED':
@@ -14,6 +14,9 @@ python manage.py collectstatic --no-input
 # Apply database migrations
 python manage.py migrate
 
+# Table backing the shared cache when REDIS_URL is not set
+python manage.py createcachetable
+
 
 python manage.py shell <<EOF
 from django.contrib.auth import get_user_model
@@ -1,5 +1,6 @@
 # location/admin.py
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.gis.admin import GISModelAdmin
 from leaflet.admin import LeafletGeoAdmin, LeafletGeoAdminMixin
 from django.utils.html import format_html
@@ -8,6 +9,34 @@ from django.utils.safestring import mark_safe
 from .models import DeliveryFeeConfig, DeliveryZone, DeliveryTimeSlot, CustomerAddress
 
 
+ZONE_TYPE_COLORS = {
+    'standard': 'blue',
+    'fixed': 'green',
+    'free': 'orange',
+    'surcharge': 'red',
+    'unavailable': 'gray'
+}
+
+# Fixed changelist badges, built once instead of per row
+ZONE_FEE_UNAVAILABLE = mark_safe('<span style="color: red; font-weight: bold;">Unavailable</span>')
+ZONE_FEE_FREE = mark_safe('<span style="color: green; font-weight: bold;">Free</span>')
+ADDRESS_FEE_UNAVAILABLE = mark_safe('<span style="color: red;">Unavailable</span>')
+ADDRESS_FEE_FREE = mark_safe('<span style="color: green;">Free</span>')
+ADDRESS_ZONE_UNASSIGNED = mark_safe('<span style="color: gray;">Not assigned</span>')
+
+
+class DeliveryZoneChangeList(ChangeList):
+    """Zone changelist that loads only the columns the list display reads"""
+    
+    def get_queryset(self, request, exclude_parameters=None):
+        return super().get_queryset(request, exclude_parameters).only(
+            'id', 'name', 'zone_type', 'fixed_price', 'surcharge_percent',
+            'center_point', 'distance_from_market', 'estimated_delivery_time',
+            'is_active', 'priority', 'updated_at',
+            'market__id', 'market__name', 'market__geo_location',
+        )
+
+
 @admin.register(DeliveryZone)
 class DeliveryZoneAdmin(LeafletGeoAdmin):
     list_display = [
@@ -36,6 +65,7 @@ class DeliveryZoneAdmin(LeafletGeoAdmin):
     
     list_editable = ['priority', 'is_active']
     list_per_page = 20
+    list_select_related = ['market']
     autocomplete_fields = ['market']
     
     # Correct Leaflet widget settings
@@ -94,6 +124,15 @@ class DeliveryZoneAdmin(LeafletGeoAdmin):
         'estimated_delivery_time'
     ]
     
+    def get_changelist(self, request, **kwargs):
+        return DeliveryZoneChangeList
+    
+    def get_search_results(self, request, queryset, search_term):
+        # Also serves the delivery_zone autocomplete on addresses, which only
+        # renders __str__: skip the polygon and join the market it names
+        queryset, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        return queryset.defer('boundary').select_related('market'), may_have_duplicates
+    
     def market_link(self, obj):
         url = reverse('admin:markets_market_change', args=[obj.market.id])
         return format_html('<a href="{}">{}</a>', url, obj.market.name)
@@ -101,14 +140,7 @@ class DeliveryZoneAdmin(LeafletGeoAdmin):
     market_link.admin_order_field = 'market__name'
     
     def zone_type_display(self, obj):
-        colors = {
-            'standard': 'blue',
-            'fixed': 'green',
-            'free': 'orange',
-            'surcharge': 'red',
-            'unavailable': 'gray'
-        }
-        color = colors.get(obj.zone_type, 'black')
+        color = ZONE_TYPE_COLORS.get(obj.zone_type, 'black')
         return format_html(
             '<span style="color: {}; font-weight: bold;">{}</span>',
             color,
@@ -131,13 +163,9 @@ class DeliveryZoneAdmin(LeafletGeoAdmin):
         if obj.center_point and obj.market.geo_location:
             sample_fee = obj.calculate_delivery_fee(obj.center_point)
             if sample_fee is None:
-                return format_html(
-                    '<span style="color: red; font-weight: bold;">Unavailable</span>'
-                )
+                return ZONE_FEE_UNAVAILABLE
             elif sample_fee == 0:
-                return format_html(
-                    '<span style="color: green; font-weight: bold;">Free</span>'
-                )
+                return ZONE_FEE_FREE
             else:
                 return f"TZS {sample_fee:,.0f}"
         return "N/A"
@@ -157,18 +185,23 @@ class DeliveryZoneAdmin(LeafletGeoAdmin):
         
         super().save_model(request, obj, form, change)
         
-        # Update all addresses in this zone
+        # Re-resolve the addresses inside this zone; the spatial index on
+        # location_point finds them and one bulk_update writes them back
         if obj.boundary:
-            from django.contrib.gis.geos import Point
             addresses = CustomerAddress.objects.filter(
                 market=obj.market,
-                location_point__isnull=False
-            )
-            
-            for address in addresses:
-                if obj.boundary.contains(address.location_point):
-                    address.delivery_zone = obj
-                    address.save()
+                location_point__within=obj.boundary
+            ).select_related('market')
+            CustomerAddress.recalculate_zones(addresses)
+
+
+class CustomerAddressChangeList(ChangeList):
+    """Address changelist without the geometries no list column reads"""
+    
+    def get_queryset(self, request, exclude_parameters=None):
+        return super().get_queryset(request, exclude_parameters).defer(
+            'location_point', 'delivery_zone__boundary', 'delivery_zone__description'
+        )
 
 
 @admin.register(CustomerAddress)
@@ -277,6 +310,9 @@ class CustomerAddressAdmin(LeafletGeoAdmin):
         }),
     )
     
+    def get_changelist(self, request, **kwargs):
+        return CustomerAddressChangeList
+    
     def customer_link(self, obj):
         url = reverse('admin:accounts_user_change', args=[obj.customer.id])
         return format_html(
@@ -299,21 +335,14 @@ class CustomerAddressAdmin(LeafletGeoAdmin):
     
     def zone_display(self, obj):
         if obj.delivery_zone:
-            colors = {
-                'standard': 'blue',
-                'fixed': 'green',
-                'free': 'orange',
-                'surcharge': 'red',
-                'unavailable': 'gray'
-            }
-            color = colors.get(obj.delivery_zone.zone_type, 'black')
+            color = ZONE_TYPE_COLORS.get(obj.delivery_zone.zone_type, 'black')
             return format_html(
                 '<span style="color: {};"><strong>{}</strong><br><small>{}</small></span>',
                 color,
                 obj.delivery_zone.name,
                 obj.delivery_zone.get_zone_type_display()
             )
-        return format_html('<span style="color: gray;">Not assigned</span>')
+        return ADDRESS_ZONE_UNASSIGNED
     zone_display.short_description = 'Delivery Zone'
     
     def distance_display(self, obj):
@@ -324,9 +353,9 @@ class CustomerAddressAdmin(LeafletGeoAdmin):
     
     def fee_display(self, obj):
         if obj.estimated_delivery_fee is None:
-            return format_html('<span style="color: red;">Unavailable</span>')
+            return ADDRESS_FEE_UNAVAILABLE
         elif obj.estimated_delivery_fee == 0:
-            return format_html('<span style="color: green;">Free</span>')
+            return ADDRESS_FEE_FREE
         else:
             return f"TZS {obj.estimated_delivery_fee:,.0f}"
     fee_display.short_description = 'Est. Fee'
@@ -350,9 +379,8 @@ class CustomerAddressAdmin(LeafletGeoAdmin):
     unverify_addresses.short_description = "Mark selected addresses as unverified"
     
     def recalculate_zones(self, request, queryset):
-        for address in queryset:
-            address.update_zone_and_fee()
-        self.message_user(request, f'Zones and fees recalculated for {queryset.count()} addresses.')
+        updated = CustomerAddress.recalculate_zones(queryset.select_related('market'))
+        self.message_user(request, f'Zones and fees recalculated for {updated} addresses.')
     recalculate_zones.short_description = "Recalculate delivery zones and fees"
     
     def save_model(self, request, obj, form, change):
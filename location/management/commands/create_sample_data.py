@@ -1,5 +1,7 @@
 # location/management/commands/create_sample_data.py
+from django.contrib.gis.geos import Polygon
 from django.core.management.base import BaseCommand
+from django.db import transaction
 from location.models import DeliveryZone, CustomerAddress
 from markets.models import Market, MarketZone
 from accounts.models import User, Customer
@@ -13,6 +15,13 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write("Creating sample data...")
         
+        # One transaction for the whole seed instead of a commit per row
+        with transaction.atomic():
+            self._create_sample_data()
+        
+        self.stdout.write(self.style.SUCCESS('Sample data creation completed!'))
+    
+    def _create_sample_data(self):
         # Create a test market
         market, created = Market.objects.get_or_create(
             name="Darajani Market",
@@ -37,67 +46,90 @@ class Command(BaseCommand):
             {'name': 'Fish Zone', 'zone_type': 'Fish'},
         ]
         
-        for zone_data in zones_data:
-            zone, created = MarketZone.objects.get_or_create(
+        # Only insert the missing zones; (market, name) is unique, so a
+        # concurrent seed inserting the same zone is skipped by the INSERT
+        existing_zones = set(
+            MarketZone.objects.filter(
                 market=market,
-                name=zone_data['name'],
-                defaults={'zone_type': zone_data['zone_type'], 'is_active': True}
-            )
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'Created market zone: {zone.name}'))
+                name__in=[zone_data['name'] for zone_data in zones_data]
+            ).values_list('name', flat=True)
+        )
+        new_zones = [
+            MarketZone(market=market, name=zone_data['name'], zone_type=zone_data['zone_type'], is_active=True)
+            for zone_data in zones_data
+            if zone_data['name'] not in existing_zones
+        ]
+        MarketZone.objects.bulk_create(new_zones, ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS(f'Created market zones: {len(new_zones)}'))
         
         # Create delivery zones if they don't exist
         delivery_zones_data = [
             {
                 'name': 'Stone Town Central',
-                'base_delivery_fee': Decimal('2000.00'),
                 'min_latitude': -6.1700, 'max_latitude': -6.1600,
                 'min_longitude': 39.1800, 'max_longitude': 39.2200,
             },
             {
                 'name': 'Stone Town Outer', 
-                'base_delivery_fee': Decimal('3000.00'),
                 'min_latitude': -6.1800, 'max_latitude': -6.1500,
                 'min_longitude': 39.1600, 'max_longitude': 39.2400,
             },
         ]
         
+        # Delivery zones have no unique key to conflict on, so look up the
+        # existing names once; new zones go through save() for distance/ETA
+        existing = set(
+            DeliveryZone.objects.filter(
+                market=market,
+                name__in=[zone_data['name'] for zone_data in delivery_zones_data]
+            ).values_list('name', flat=True)
+        )
+        created_count = 0
         for zone_data in delivery_zones_data:
-            zone, created = DeliveryZone.objects.get_or_create(
+            if zone_data['name'] in existing:
+                continue
+            boundary = Polygon.from_bbox((
+                zone_data['min_longitude'], zone_data['min_latitude'],
+                zone_data['max_longitude'], zone_data['max_latitude'],
+            ))
+            boundary.srid = 4326
+            DeliveryZone.objects.create(
                 market=market,
                 name=zone_data['name'],
-                defaults=zone_data
+                zone_type='standard',
+                boundary=boundary,
+                center_point=boundary.centroid
             )
-            if created:
-                self.stdout.write(self.style.SUCCESS(f'Created delivery zone: {zone.name}'))
+            created_count += 1
+        self.stdout.write(self.style.SUCCESS(f'Created delivery zones: {created_count}'))
         
         # Create a test customer
         try:
-            user, created = User.objects.get_or_create(
-                phone_number='+255123456789',
-                defaults={
-                    'user_type': 'customer',
-                    'is_verified': True,
-                    'is_active': True
-                }
-            )
-            
-            if created:
-                user.set_password('password123')
-                user.save()
-                
-                customer, cust_created = Customer.objects.get_or_create(
-                    user=user,
+            # Savepoint, so a failure here doesn't poison the seed transaction
+            with transaction.atomic():
+                user, created = User.objects.get_or_create(
+                    phone_number='+255123456789',
                     defaults={
-                        'names': 'John Test Customer',
-                        'address': 'Test Address, Stone Town'
+                        'user_type': 'customer',
+                        'is_verified': True,
+                        'is_active': True
                     }
                 )
+            
+                if created:
+                    user.set_password('password123')
+                    user.save()
+                
+                    customer, cust_created = Customer.objects.get_or_create(
+                        user=user,
+                        defaults={
+                            'names': 'John Test Customer',
+                            'address': 'Test Address, Stone Town'
+                        }
+                    )
                 
-                if cust_created:
-                    self.stdout.write(self.style.SUCCESS('Created test customer'))
+                    if cust_created:
+                        self.stdout.write(self.style.SUCCESS('Created test customer'))
         
         except Exception as e:
             self.stdout.write(self.style.WARNING(f'Could not create test customer: {e}'))
-        
-        self.stdout.write(self.style.SUCCESS('Sample data creation completed!'))
\ No newline at end of file
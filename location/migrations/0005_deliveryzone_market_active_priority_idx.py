@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-16 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0004_alter_customeraddress_latitude_and_more'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='deliveryzone',
+            name='delivery_zo_market__7176ee_idx',
+        ),
+        migrations.AddIndex(
+            model_name='deliveryzone',
+            index=models.Index(fields=['market', 'is_active', 'priority'], name='delivery_zo_market__cd3bcf_idx'),
+        ),
+    ]
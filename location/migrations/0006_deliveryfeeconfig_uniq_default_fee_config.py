@@ -0,0 +1,40 @@
+"""
+Enforce a single default DeliveryFeeConfig in the database.
+
+Data fix-up: before adding the constraint, any extra defaults are demoted,
+keeping the most recently updated one as the default. Those rows are
+rewritten in place (is_default=False) and the reverse migration does not
+restore them.
+"""
+from django.db import migrations, models
+
+
+def keep_one_default_config(apps, schema_editor):
+    DeliveryFeeConfig = apps.get_model('location', 'DeliveryFeeConfig')
+
+    default_ids = list(
+        DeliveryFeeConfig.objects.filter(is_default=True)
+        .order_by('-updated_at')
+        .values_list('id', flat=True)
+    )
+    if len(default_ids) > 1:
+        DeliveryFeeConfig.objects.filter(id__in=default_ids[1:]).update(is_default=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('location', '0005_deliveryzone_market_active_priority_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_one_default_config, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='deliveryfeeconfig',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('is_default', True)),
+                fields=('is_default',),
+                name='uniq_default_fee_config',
+            ),
+        ),
+    ]
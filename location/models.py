@@ -4,8 +4,18 @@ from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 from django.contrib.gis.db import models as gis_models
+from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.geos import Point
 from django.core.exceptions import ValidationError
+from django.core.cache import cache
+
+from .pricing import calculation_method, from_cents, haversine_km, measure_km, to_cents
+
+
+# Active fee config is read on nearly every delivery request; cache it briefly
+# and drop the entry whenever a config row changes (see location/signals.py).
+ACTIVE_CONFIG_CACHE_KEY = 'delivery_fee_config:active'
+ACTIVE_CONFIG_CACHE_TTL = 300
 
 
 class DeliveryFeeConfig(models.Model):
@@ -107,32 +117,58 @@ class DeliveryFeeConfig(models.Model):
     class Meta:
         db_table = 'delivery_fee_configs'
         ordering = ['-is_default', 'name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_default'],
+                condition=models.Q(is_default=True),
+                name='uniq_default_fee_config'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.name} ({'Default' if self.is_default else 'Custom'})"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._was_default = instance.__dict__.get('is_default')
+        return instance
+    
     def clean(self):
         """Ensure only one default configuration"""
-        if self.is_default:
+        # Only a config becoming the default has others to demote
+        if self.is_default and not getattr(self, '_was_default', False):
             DeliveryFeeConfig.objects.filter(is_default=True).exclude(id=self.id).update(is_default=False)
     
     def save(self, *args, **kwargs):
         self.clean()
         super().save(*args, **kwargs)
+        self._was_default = self.is_default
     
-    def get_active_config():
-        """Get active configuration (default or first active)"""
+    @classmethod
+    def get_active_config(cls):
+        """Get active configuration (default or first active), cached"""
+        return cache.get_or_set(ACTIVE_CONFIG_CACHE_KEY, cls._load_active_config, ACTIVE_CONFIG_CACHE_TTL)
+    
+    @classmethod
+    def get_calculation_method(cls):
+        """Distance calculation method of the active configuration"""
+        return calculation_method(cls.get_active_config())
+    
+    @classmethod
+    def _load_active_config(cls):
+        """Resolve the active configuration from the database"""
         try:
-            config = DeliveryFeeConfig.objects.get(is_default=True, is_active=True)
-        except DeliveryFeeConfig.DoesNotExist:
-            config = DeliveryFeeConfig.objects.filter(is_active=True).first()
+            config = cls.objects.get(is_default=True, is_active=True)
+        except cls.DoesNotExist:
+            config = cls.objects.filter(is_active=True).first()
 
         # If there is no active config in the database, return a sensible
         # in-memory default so the API and admin pages behave predictably.
         # Default rule: first 1 km is TZS 2000 (admin can override this by
         # creating a DeliveryFeeConfig in the admin UI).
         if not config:
-            return DeliveryFeeConfig(
+            return cls(
                 name='Default (fallback)',
                 calculation_method='haversine',
                 base_fee=Decimal('2000.00'),
@@ -244,7 +280,9 @@ class DeliveryZone(models.Model):
         unique_together = ['market', 'name']
         ordering = ['market', 'priority', 'name']
         indexes = [
-            models.Index(fields=['market', 'is_active']),
+            # Zone resolution filters on market + is_active and orders by priority;
+            # boundary lookups use the GIST index created by PolygonField
+            models.Index(fields=['market', 'is_active', 'priority']),
             models.Index(fields=['zone_type', 'is_active']),
         ]
     
@@ -278,40 +316,42 @@ class DeliveryZone(models.Model):
         
         super().save(*args, **kwargs)
     
-    def _calculate_distance(self, point1, point2):
+    def _calculate_distance(self, point1, point2, method=None):
         """Calculate distance between two points in km"""
-        from math import radians, sin, cos, sqrt, atan2
-        
-        # Convert to lat/lng
-        lat1 = radians(point1.y)
-        lon1 = radians(point1.x)
-        lat2 = radians(point2.y)
-        lon2 = radians(point2.x)
-        
-        # Haversine formula
-        R = 6371  # Earth radius in km
-        dlon = lon2 - lon1
-        dlat = lat2 - lat1
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1-a))
-        distance = R * c
-        
-        return Decimal(str(distance))
+        if method is None:
+            method = DeliveryFeeConfig.get_calculation_method()
+        return Decimal(str(measure_km(point1.y, point1.x, point2.y, point2.x, method)))
     
     def calculate_delivery_fee(self, customer_point=None, order_amount=Decimal('0.00')):
         """Calculate delivery fee based on zone type and location"""
+        # Answers that do not depend on the fee config
+        if self.zone_type == 'unavailable':
+            return None  # Delivery not available
+        range_checked = bool(customer_point and self.distance_from_market)
+        if self.zone_type == 'free' and not range_checked:
+            return Decimal('0.00')
+        
         config = DeliveryFeeConfig.get_active_config()
         if not config:
             return Decimal('0.00')
         
         # Free delivery for orders above threshold
-        if order_amount >= config.free_delivery_threshold and self.zone_type != 'unavailable':
+        if order_amount >= config.free_delivery_threshold:
             return Decimal('0.00')
         
+        # The range check and the distance fee share one float distance
+        distance = None
+        market_point = self.market.geo_location
+        if customer_point and market_point:
+            distance = measure_km(
+                market_point.y, market_point.x,
+                customer_point.y, customer_point.x,
+                calculation_method(config)
+            )
+        
         # Check maximum distance
-        if customer_point and self.distance_from_market:
-            distance = self._calculate_distance(self.market.geo_location, customer_point)
-            if distance > config.max_delivery_distance:
+        if distance is not None and range_checked:
+            if distance > float(config.max_delivery_distance):
                 return None  # Delivery not available
         
         # Calculate based on zone type
@@ -319,23 +359,20 @@ class DeliveryZone(models.Model):
             return self.fixed_price
         elif self.zone_type == 'free':
             return Decimal('0.00')
-        elif self.zone_type == 'unavailable':
-            return None  # Delivery not available
         elif self.zone_type == 'surcharge':
-            base_fee = self._calculate_distance_fee(customer_point, config)
-            surcharge = base_fee * (self.surcharge_percent / 100)
-            return base_fee + surcharge
+            base_cents = self._calculate_distance_fee_cents(distance, config)
+            surcharge_cents = round(base_cents * float(self.surcharge_percent) / 100)
+            return from_cents(base_cents + surcharge_cents)
         else:  # standard
-            return self._calculate_distance_fee(customer_point, config)
+            return from_cents(self._calculate_distance_fee_cents(distance, config))
     
-    def _calculate_distance_fee(self, customer_point, config):
-        """Calculate distance-based fee"""
-        if not customer_point or not self.market.geo_location:
-            return config.base_fee
+    def _calculate_distance_fee_cents(self, distance, config):
+        """Calculate distance-based fee in integer cents"""
+        base_cents = to_cents(config.base_fee)
+        if distance is None:
+            return base_cents
         
-        distance = self._calculate_distance(self.market.geo_location, customer_point)
-        calculated_fee = config.base_fee + (distance * config.per_km_rate)
-        return max(config.base_fee, calculated_fee)
+        return max(base_cents, base_cents + round(distance * to_cents(config.per_km_rate)))
     
     def contains_location(self, latitude, longitude):
         """Check if a location is within this zone's boundary"""
@@ -380,26 +417,31 @@ class DeliveryTimeSlot(models.Model):
     def __str__(self):
         return f"{self.name} ({self.delivery_start_time} - {self.delivery_end_time})"
     
-    def get_available_slots(date):
-        """Get available slots for a given date"""
+    @classmethod
+    def get_available_slots(cls, date):
+        """Get available slots for a given date as a lazy queryset"""
         from django.utils import timezone
-        from datetime import datetime, time
         
         now = timezone.now()
-        current_time = now.time()
-        
-        slots = DeliveryTimeSlot.objects.filter(is_active=True)
-        available_slots = []
+        slots = cls.objects.filter(is_active=True)
         
-        for slot in slots:
-            # Check if slot is still available for today
-            if now.date() == date.date():
-                if current_time < slot.cut_off_time:
-                    available_slots.append(slot)
-            else:
-                available_slots.append(slot)
+        # Today's slots are only available until their cut-off time
+        if now.date() == date.date():
+            slots = slots.filter(cut_off_time__gt=now.time())
         
-        return available_slots
+        return slots
+
+
+def nearest_zone_by_center(point, zones):
+    """Zone whose center point is closest to point, or None if none has one"""
+    centered = [zone for zone in zones if zone.center_point]
+    if not centered:
+        return None
+    lat, lng = point.y, point.x
+    return min(
+        centered,
+        key=lambda zone: haversine_km(lat, lng, zone.center_point.y, zone.center_point.x)
+    )
 
 
 class CustomerAddress(models.Model):
@@ -495,72 +537,157 @@ class CustomerAddress(models.Model):
                 is_default=True
             ).exclude(id=self.id).update(is_default=False)
         
-        # Create location point from coordinates
-        if self.latitude is not None and self.longitude is not None:
+        # Create location point from coordinates; an unchanged address keeps
+        # the point it was loaded with
+        location_changed = self._location_changed()
+        if self.latitude is not None and self.longitude is not None and (
+            location_changed or not self.location_point
+        ):
             self.location_point = Point(float(self.longitude), float(self.latitude), srid=4326)
         
-        # Auto-detect delivery zone
-        if self.location_point and self.market:
-            self.delivery_zone = self._detect_delivery_zone()
-            
-            # Calculate distance and estimated fee
-            if self.delivery_zone:
-                self.distance_from_market = self.delivery_zone._calculate_distance(
-                    self.market.geo_location,
-                    self.location_point
-                )
-                self.estimated_delivery_fee = self.delivery_zone.calculate_delivery_fee(
-                    self.location_point
-                )
-                self.estimated_delivery_time = self.delivery_zone.estimated_delivery_time
+        # Auto-detect delivery zone, skipping saves that leave the location
+        # alone (label edits, default toggles) once a zone is assigned
+        if self.location_point and self.market and (
+            self.delivery_zone_id is None or location_changed
+        ):
+            self._refresh_zone()
+        self._cleaned_state = self._clean_state()
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_location = instance._location_key()
+        return instance
+    
+    def _location_key(self):
+        """Fields that decide the zone, read without loading deferred ones"""
+        return tuple(self.__dict__.get(name) for name in ('market_id', 'latitude', 'longitude'))
+    
+    def _clean_state(self):
+        """Fields clean() reads or writes, to tell whether it already ran"""
+        return self._location_key() + (self.is_default, self.__dict__.get('delivery_zone_id'))
+    
+    def _location_changed(self):
+        """True for new addresses or when market/coordinates changed since load"""
+        loaded = getattr(self, '_loaded_location', None)
+        return loaded is None or None in loaded or loaded != self._location_key()
+    
+    def _refresh_zone(self):
+        """Re-detect the zone and its estimates for the current location"""
+        self.delivery_zone = self._detect_delivery_zone()
+        self._apply_zone_estimates()
+    
+    def _apply_zone_estimates(self):
+        """Calculate distance and estimated fee from the assigned zone"""
+        if self.delivery_zone:
+            # The coordinate columns already hold the point as numbers, so
+            # the distance skips the GEOS accessors on location_point
+            market_point = self.market.geo_location
+            self.distance_from_market = Decimal(str(measure_km(
+                market_point.y, market_point.x,
+                float(self.latitude), float(self.longitude),
+                DeliveryFeeConfig.get_calculation_method()
+            )))
+            self.estimated_delivery_fee = self.delivery_zone.calculate_delivery_fee(
+                self.location_point
+            )
+            self.estimated_delivery_time = self.delivery_zone.estimated_delivery_time
     
     def save(self, *args, **kwargs):
-        self.clean()
+        # Model forms already ran clean() through full_clean()
+        if getattr(self, '_cleaned_state', None) != self._clean_state():
+            self.clean()
         super().save(*args, **kwargs)
+        self._loaded_location = self._location_key()
+        self._cleaned_state = None
     
     def _detect_delivery_zone(self):
         """Find the appropriate delivery zone for this address"""
         if not self.location_point or not self.market:
             return None
         
-        # Try to find zones that contain this point
+        # The polygon is only needed by the SQL filter; the fee estimate reads
+        # the zone's market, so join it
         zones = DeliveryZone.objects.filter(
             market=self.market,
-            is_active=True,
-            boundary__contains=self.location_point
-        ).order_by('priority')
+            is_active=True
+        ).defer('boundary', 'description').select_related('market')
         
-        if zones.exists():
-            return zones.first()
+        # Try to find zones that contain this point
+        zone = zones.filter(
+            boundary__contains=self.location_point
+        ).order_by('priority').first()
+        if zone is not None:
+            return zone
         
-        # If no zone contains the point, find nearest zone
-        zones = DeliveryZone.objects.filter(
-            market=self.market,
-            is_active=True,
+        # If no zone contains the point, let the database pick the zone with
+        # the nearest center point
+        return zones.filter(
             center_point__isnull=False
-        )
+        ).annotate(
+            center_distance=Distance('center_point', self.location_point)
+        ).order_by('center_distance', 'priority').first()
+    
+    def _pick_delivery_zone(self, zones):
+        """
+        Same rules as _detect_delivery_zone over preloaded (zone, prepared
+        boundary) pairs ordered by priority
+        """
+        for zone, boundary in zones:
+            if boundary is not None and boundary.contains(self.location_point):
+                return zone
+        return nearest_zone_by_center(self.location_point, [zone for zone, _ in zones])
+    
+    @classmethod
+    def recalculate_zones(cls, addresses):
+        """
+        Re-detect zone, distance, fee and time for many addresses at once.
+        
+        Active zones are loaded once per market instead of per address and
+        the results are written back with a single bulk_update.
+        Returns the number of addresses processed.
+        """
+        from django.utils import timezone
+        
+        addresses = list(addresses)
+        zones_by_market = {}
+        now = timezone.now()
         
-        if zones.exists():
-            # Calculate distance to each zone's center point
-            nearest_zone = None
-            min_distance = float('inf')
+        for address in addresses:
+            if address.latitude is not None and address.longitude is not None:
+                address.location_point = Point(float(address.longitude), float(address.latitude), srid=4326)
+            address.updated_at = now
+            if not address.location_point or not address.market_id:
+                continue
             
-            for zone in zones:
-                distance = zone._calculate_distance(
-                    self.location_point,
-                    zone.center_point
-                )
-                if distance < min_distance:
-                    min_distance = distance
-                    nearest_zone = zone
+            zones = zones_by_market.get(address.market_id)
+            if zones is None:
+                zones = zones_by_market[address.market_id] = [
+                    (zone, zone.boundary.prepared if zone.boundary else None)
+                    for zone in DeliveryZone.objects.filter(
+                        market_id=address.market_id,
+                        is_active=True
+                    ).select_related('market').order_by('priority')
+                ]
             
-            return nearest_zone
+            address.delivery_zone = address._pick_delivery_zone(zones)
+            address._apply_zone_estimates()
         
-        return None
+        cls.objects.bulk_update(addresses, [
+            'delivery_zone',
+            'distance_from_market',
+            'estimated_delivery_fee',
+            'estimated_delivery_time',
+            'location_point',
+            'updated_at'
+        ], batch_size=500)
+        return len(addresses)
     
     def update_zone_and_fee(self):
         """Update zone assignment and fee calculation"""
-        self.clean()
+        # Zones or fees may have changed even if the address did not
+        self._loaded_location = None
+        self._cleaned_state = None
         self.save(update_fields=[
             'delivery_zone',
             'distance_from_market',
@@ -570,22 +697,19 @@ class CustomerAddress(models.Model):
             'updated_at'
         ])
     
+    ADDRESS_FORMAT = (
+        ('', 'street_address'),
+        ('Near ', 'landmark'),
+        ('', 'area'),
+        ('Ward: ', 'ward'),
+        ('District: ', 'district'),
+        ('Region: ', 'region'),
+    )
+    
     def get_formatted_address(self):
         """Get formatted address string"""
-        parts = []
-        if self.street_address:
-            parts.append(self.street_address)
-        if self.landmark:
-            parts.append(f"Near {self.landmark}")
-        if self.area:
-            parts.append(self.area)
-        if self.ward:
-            parts.append(f"Ward: {self.ward}")
-        if self.district:
-            parts.append(f"District: {self.district}")
-        if self.region:
-            parts.append(f"Region: {self.region}")
-        return ", ".join(parts)
+        values = ((prefix, getattr(self, name)) for prefix, name in self.ADDRESS_FORMAT)
+        return ", ".join(f"{prefix}{value}" for prefix, value in values if value)
     
     def get_delivery_estimate(self):
         """Get delivery estimate string"""
@@ -0,0 +1,150 @@
+# location/pricing.py
+"""
+Shared delivery pricing helpers used by the delivery fee API views and
+DeliveryZone.calculate_delivery_fee.
+
+Distances are floats in km. Money is computed in integer cents (to_cents)
+on every path, so the API views and the stored address/order fees agree;
+it is converted back only at the boundary (from_cents for model Decimals,
+cents / 100 for JSON responses).
+"""
+from decimal import Decimal
+from math import pi, sin, cos, sqrt, asin, hypot
+
+
+EARTH_RADIUS_KM = 6371.0
+DEG2RAD = pi / 180.0
+PI_SQUARED = pi * pi
+
+# Fallbacks used when no DeliveryFeeConfig is available
+DEFAULT_BASE_FEE = 1000.0
+DEFAULT_PER_KM_RATE = 500.0
+DEFAULT_FREE_DELIVERY_THRESHOLD = 50000.0
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in km"""
+    lat1 *= DEG2RAD
+    lat2 *= DEG2RAD
+    dlat = lat2 - lat1
+    dlng = (lng2 - lng1) * DEG2RAD
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlng / 2) ** 2
+    # 2*asin(sqrt(a)) == 2*atan2(sqrt(a), sqrt(1-a)) for a in [0, 1]
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(min(a, 1.0)))
+
+
+def _cos_approx(x):
+    """
+    Bhaskara's rational approximation of cos(x) for |x| <= pi/2, within
+    0.0016 of the real value, using only multiplications and one division
+    """
+    x2 = x * x
+    return (PI_SQUARED - 4 * x2) / (PI_SQUARED + x2)
+
+
+def equirectangular_km(lat1, lng1, lat2, lng2):
+    """
+    Equirectangular approximation of the distance in km. Trig-free (the
+    latitude scale uses _cos_approx); accurate enough within a city.
+    """
+    dlat = (lat2 - lat1) * DEG2RAD
+    dlng = (lng2 - lng1) * DEG2RAD * _cos_approx((lat1 + lat2) * DEG2RAD / 2)
+    return EARTH_RADIUS_KM * hypot(dlat, dlng)
+
+
+def manhattan_km(lat1, lng1, lat2, lng2):
+    """City-block distance in km along the north-south and east-west axes"""
+    dlat = (lat2 - lat1) * DEG2RAD
+    dlng = (lng2 - lng1) * DEG2RAD * _cos_approx((lat1 + lat2) * DEG2RAD / 2)
+    return EARTH_RADIUS_KM * (abs(dlat) + abs(dlng))
+
+
+# DeliveryFeeConfig.calculation_method -> distance function
+DISTANCE_FUNCTIONS = {
+    'haversine': haversine_km,
+    'euclidean': equirectangular_km,
+    'manhattan': manhattan_km,
+}
+DEFAULT_CALCULATION_METHOD = 'haversine'
+
+
+def calculation_method(config):
+    """Distance method of a DeliveryFeeConfig, haversine without one"""
+    method = config.calculation_method if config else None
+    return method if method in DISTANCE_FUNCTIONS else DEFAULT_CALCULATION_METHOD
+
+
+def measure_km(lat1, lng1, lat2, lng2, method=DEFAULT_CALCULATION_METHOD):
+    """Distance in km using a DeliveryFeeConfig calculation method"""
+    return DISTANCE_FUNCTIONS.get(method, haversine_km)(lat1, lng1, lat2, lng2)
+
+
+def to_cents(amount):
+    """Convert a currency amount (Decimal, float or None) to integer cents"""
+    return int(round((amount or 0) * 100))
+
+
+def from_cents(cents):
+    """Convert integer cents back to a two-place Decimal amount"""
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def compute_zone_fee(zone, config, distance_km, order_total):
+    """
+    Calculate the delivery fee for a zone, or the default distance-based
+    rules when zone is None.
+
+    Returns (fee, fee_breakdown, reason). fee is None when the zone does
+    not accept deliveries.
+    """
+    base_cents = to_cents(config.base_fee if config else DEFAULT_BASE_FEE)
+    km_rate_cents = to_cents(config.per_km_rate if config else DEFAULT_PER_KM_RATE)
+    free_threshold = float(config.free_delivery_threshold) if config else DEFAULT_FREE_DELIVERY_THRESHOLD
+
+    fee_breakdown = {
+        'base_fee': 0,
+        'surcharge': 0,
+        'discount_applied': None,
+    }
+    zone_type = zone.zone_type if zone else 'standard'
+
+    if zone_type == 'unavailable':
+        return None, fee_breakdown, f'Delivery not available to {zone.name}'
+
+    if zone_type == 'fixed':
+        fee = to_cents(zone.fixed_price) / 100
+        fee_breakdown['base_fee'] = fee
+        return fee, fee_breakdown, f'Fixed price zone: {zone.name}'
+
+    if zone_type == 'free':
+        fee_breakdown['discount_applied'] = 'free_zone'
+        return 0.0, fee_breakdown, f'Free delivery zone: {zone.name}'
+
+    if zone_type == 'surcharge':
+        surcharge_pct = float(zone.surcharge_percent or 0)
+        surcharge_cents = round(base_cents * surcharge_pct / 100)
+        fee_breakdown['base_fee'] = base_cents / 100
+        fee_breakdown['surcharge'] = surcharge_cents / 100
+        return (
+            (base_cents + surcharge_cents) / 100,
+            fee_breakdown,
+            f'Surcharge zone {zone.name}: {surcharge_pct:.2f}% surcharge applied'
+        )
+
+    # standard (distance-based)
+    if order_total >= free_threshold:
+        fee_breakdown['discount_applied'] = 'free_delivery_threshold'
+        return (
+            0.0,
+            fee_breakdown,
+            f'Free delivery because order total ({order_total:.2f}) >= free threshold ({free_threshold:.2f})'
+        )
+
+    distance_km = distance_km or 0.0
+    label = 'Distance-based' if zone else 'Default calculation'
+    fee_breakdown['base_fee'] = base_cents / 100
+    return (
+        (base_cents + round(distance_km * km_rate_cents)) / 100,
+        fee_breakdown,
+        f'{label}: {distance_km:.2f}km x {km_rate_cents / 100:.0f} TZS/km + {base_cents / 100:.0f} TZS base'
+    )
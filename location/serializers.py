@@ -14,13 +14,15 @@ class DeliveryZoneSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = DeliveryZone
-        fields = ['id', 'market', 'market_name', 'name', 'description', 
-                 'base_delivery_fee', 'is_manual_pricing', 'manual_delivery_fee',
-                 'is_active', 'created_at']
+        fields = ['id', 'market', 'market_name', 'name', 'description',
+                 'zone_type', 'fixed_price', 'surcharge_percent',
+                 'distance_from_market', 'estimated_delivery_time',
+                 'priority', 'is_active', 'created_at']
 
 class CustomerAddressSerializer(serializers.ModelSerializer):
     market_name = serializers.CharField(source='market.name', read_only=True)
     delivery_zone_name = serializers.CharField(source='delivery_zone.name', read_only=True)
+    # Zone, distance and estimated fee are filled in by CustomerAddress.save()
     estimated_delivery_fee = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     
     class Meta:
@@ -31,23 +33,25 @@ class CustomerAddressSerializer(serializers.ModelSerializer):
                  'additional_notes', 'is_default', 'is_active', 
                  'estimated_delivery_fee', 'created_at']
         read_only_fields = ['customer']
-    
-    def validate(self, data):
-        # Calculate delivery fee if coordinates are provided
-        if data.get('latitude') and data.get('longitude') and data.get('market'):
-            delivery_zone = data.get('delivery_zone')
-            if delivery_zone:
-                data['estimated_delivery_fee'] = delivery_zone.calculate_delivery_fee(
-                    data['latitude'], data['longitude']
-                )
-        return data
 
 class MarketWithZonesSerializer(serializers.ModelSerializer):
+    """
+    Market with its delivery zones and the delivery time slots.
+    Callers should prefetch delivery_zones (see markets_with_delivery_info).
+    """
     delivery_zones = DeliveryZoneSerializer(many=True, read_only=True)
-    time_slots = DeliveryTimeSlotSerializer(many=True, read_only=True)
+    time_slots = serializers.SerializerMethodField()
     
     class Meta:
         model = Market
         fields = ['id', 'name', 'description', 'location', 'latitude', 'longitude',
                  'address', 'contact_phone', 'opening_time', 'closing_time',
-                 'delivery_zones', 'time_slots']
\ No newline at end of file
+                 'delivery_zones', 'time_slots']
+    
+    def get_time_slots(self, obj):
+        # Slots are not tied to a market; serialize them once per response
+        if '_time_slots' not in self.__dict__:
+            self._time_slots = DeliveryTimeSlotSerializer(
+                DeliveryTimeSlot.objects.filter(is_active=True), many=True
+            ).data
+        return self._time_slots
@@ -0,0 +1,19 @@
+# location/signals.py
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import DeliveryFeeConfig, DeliveryZone, ACTIVE_CONFIG_CACHE_KEY
+from .zone_cache import bump_zones_version
+
+
+@receiver([post_save, post_delete], sender=DeliveryFeeConfig)
+def invalidate_active_config(sender, **kwargs):
+    """Drop the cached active config whenever a config row changes"""
+    cache.delete(ACTIVE_CONFIG_CACHE_KEY)
+
+
+@receiver([post_save, post_delete], sender=DeliveryZone)
+def invalidate_delivery_zones(sender, **kwargs):
+    """Expire per-process zone caches whenever a zone row changes"""
+    bump_zones_version()
@@ -1,3 +1,41 @@
+from decimal import Decimal
+
 from django.test import TestCase
 
-# Create your tests here.
+from .models import DeliveryFeeConfig
+
+
+class DeliveryFeeConfigTestCase(TestCase):
+    """Test there is only ever one default fee configuration"""
+    
+    def _create_config(self, name, is_default):
+        return DeliveryFeeConfig.objects.create(
+            name=name,
+            base_fee=Decimal('500.00'),
+            per_km_rate=Decimal('200.00'),
+            is_default=is_default
+        )
+    
+    def test_new_default_demotes_previous_default(self):
+        """Saving a second default demotes the first"""
+        first = self._create_config('First', is_default=True)
+        second = self._create_config('Second', is_default=True)
+        
+        first.refresh_from_db()
+        self.assertFalse(first.is_default)
+        self.assertTrue(DeliveryFeeConfig.objects.get(pk=second.pk).is_default)
+    
+    def test_promoting_loaded_config_demotes_default(self):
+        """A config loaded as non-default and then made default demotes the old one"""
+        first = self._create_config('First', is_default=True)
+        second = DeliveryFeeConfig.objects.get(pk=self._create_config('Second', is_default=False).pk)
+        
+        second.is_default = True
+        second.save()
+        
+        self.assertEqual(
+            list(DeliveryFeeConfig.objects.filter(is_default=True).values_list('pk', flat=True)),
+            [second.pk]
+        )
+        first.refresh_from_db()
+        self.assertFalse(first.is_default)
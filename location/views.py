@@ -3,7 +3,8 @@ from decimal import Decimal
 from rest_framework import status, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from django.db.models import Q
+from django.contrib.gis.geos import Point
+from django.db.models import Prefetch, Q
 from django.utils import timezone
 from datetime import datetime, time
 from .models import DeliveryTimeSlot, DeliveryZone, CustomerAddress
@@ -59,8 +60,12 @@ def calculate_delivery_time(request):
 @permission_classes([permissions.AllowAny])
 def markets_with_delivery_info(request):
     """Get all markets with delivery zones and time slots"""
+    # Active zones only, without their boundary polygons
     markets = Market.objects.filter(is_active=True).prefetch_related(
-        'delivery_zones', 'zones'
+        Prefetch(
+            'delivery_zones',
+            queryset=DeliveryZone.objects.filter(is_active=True).defer('boundary')
+        )
     )
     serializer = MarketWithZonesSerializer(markets, many=True)
     return Response(serializer.data)
@@ -81,31 +86,34 @@ def calculate_delivery_fee(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    point = None
+    if latitude is not None and longitude is not None:
+        try:
+            point = Point(float(longitude), float(latitude), srid=4326)
+        except (TypeError, ValueError):
+            point = None
+    if point is None and not zone_id:
+        return Response(
+            {'error': 'latitude and longitude are required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
     try:
         market = Market.objects.get(id=market_id, is_active=True)
         
         if zone_id:
             # Use specific zone
             zone = DeliveryZone.objects.get(id=zone_id, market=market, is_active=True)
-            delivery_fee = zone.calculate_delivery_fee(latitude, longitude)
+            delivery_fee = zone.calculate_delivery_fee(point)
         else:
-            # Find appropriate zone based on coordinates
-            zones = DeliveryZone.objects.filter(market=market, is_active=True)
-            delivery_fee = None
-            
-            for zone in zones:
-                # Check if coordinates fall within zone boundaries
-                if (zone.min_latitude and zone.max_latitude and 
-                    zone.min_longitude and zone.max_longitude):
-                    if (zone.min_latitude <= float(latitude) <= zone.max_latitude and
-                        zone.min_longitude <= float(longitude) <= zone.max_longitude):
-                        delivery_fee = zone.calculate_delivery_fee(latitude, longitude)
-                        break
-            
-            if delivery_fee is None:
-                # Use base zone or minimum fee
-                base_zone = zones.first()
-                delivery_fee = base_zone.calculate_delivery_fee(latitude, longitude) if base_zone else Decimal('2000.00')
+            # Let the boundary index find the zone containing the coordinates
+            zones = DeliveryZone.objects.filter(
+                market=market,
+                is_active=True
+            ).defer('boundary', 'description').select_related('market').order_by('priority')
+            zone = zones.filter(boundary__contains=point).first() or zones.first()
+            # Use base zone or minimum fee
+            delivery_fee = zone.calculate_delivery_fee(point) if zone else Decimal('2000.00')
         
         return Response({
             'market': market.name,
@@ -141,26 +149,7 @@ def customer_addresses(request):
         data = request.data.copy()
         data['customer'] = request.user.id
         
-        # Calculate delivery fee
-        market_id = data.get('market')
-        latitude = data.get('latitude')
-        longitude = data.get('longitude')
-        zone_id = data.get('delivery_zone')
-        
-        if market_id and latitude and longitude:
-            try:
-                market = Market.objects.get(id=market_id)
-                if zone_id:
-                    zone = DeliveryZone.objects.get(id=zone_id, market=market)
-                else:
-                    zone = DeliveryZone.objects.filter(market=market, is_active=True).first()
-                
-                if zone:
-                    data['delivery_zone'] = zone.id
-                    data['estimated_delivery_fee'] = zone.calculate_delivery_fee(latitude, longitude)
-            except (Market.DoesNotExist, DeliveryZone.DoesNotExist):
-                pass
-        
+        # Zone and delivery fee are detected when the address is saved
         serializer = CustomerAddressSerializer(data=data)
         if serializer.is_valid():
             address = serializer.save()
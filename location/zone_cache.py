@@ -0,0 +1,86 @@
+# location/zone_cache.py
+"""
+Per-process cache of the active delivery zones of each market.
+
+Zones change rarely but are read on every delivery fee request, so each
+worker keeps them locally, tagged with (version, time bucket). The version
+lives in the shared Django cache (Redis or the database cache table) and is
+bumped whenever a zone changes, which makes every worker drop its stale
+entries on next read. The time bucket bounds how long an entry can outlive a
+change that bypassed the bump, e.g. a queryset .update().
+"""
+import time
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+
+
+ZONES_VERSION_CACHE_KEY = 'delivery_zones:version'
+# Longest a worker serves its local copy of a market's zones
+ZONES_LOCAL_TTL = 60
+
+# (version, bucket) the entries were loaded under, and market_id -> zones
+_local_zones = (None, {})
+
+
+def zones_version():
+    """Current zones version shared by all workers"""
+    return cache.get_or_set(ZONES_VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def bump_zones_version():
+    """Invalidate cached zones in every worker"""
+    cache.set(ZONES_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
+
+
+def active_zones_by_market(market_ids):
+    """
+    Active zones of each market by priority, paired with a prepared boundary.
+    Markets missing from the local cache are loaded together in one query.
+    """
+    global _local_zones
+    from .models import DeliveryZone
+
+    tag = (zones_version(), int(time.monotonic() // ZONES_LOCAL_TTL))
+    if _local_zones[0] != tag:
+        _local_zones = (tag, {})
+    markets = _local_zones[1]
+
+    missing = {market_id for market_id in market_ids if market_id not in markets}
+    if missing:
+        loaded = defaultdict(list)
+        zones = DeliveryZone.objects.filter(
+            market_id__in=missing,
+            is_active=True
+        ).order_by('market_id', 'priority')
+        for zone in zones:
+            loaded[zone.market_id].append(
+                (zone, zone.boundary.prepared if zone.boundary else None)
+            )
+        for market_id in missing:
+            markets[market_id] = tuple(loaded[market_id])
+
+    return {market_id: markets[market_id] for market_id in market_ids}
+
+
+def _pick_zone(zones, point):
+    """Highest priority zone containing point, else the first with a center point"""
+    for zone, boundary in zones:
+        if boundary is not None and boundary.contains(point):
+            return zone
+    for zone, _ in zones:
+        if zone.center_point:
+            return zone
+    return None
+
+
+def resolve_delivery_zones(market_ids, point):
+    """
+    Return {market_id: zone} with the highest priority zone containing point,
+    falling back to the highest priority zone with a center point, or None.
+    """
+    return {
+        market_id: _pick_zone(zones, point)
+        for market_id, zones in active_zones_by_market(market_ids).items()
+    }
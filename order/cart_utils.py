@@ -2,7 +2,7 @@
 Cart utilities and helper functions for calculations and validations
 """
 from decimal import Decimal
-from django.db.models import Sum, F
+from django.db.models import Sum, F, Count
 from products.models import UnitPrice, ProductAddon, MeasurementUnit
 from order.models import CartItem
 
@@ -204,13 +204,25 @@ class CartService:
     @staticmethod
     def get_cart_summary(cart) -> dict:
         """Get complete cart summary"""
-        items = cart.items.all()
-        subtotal = CartCalculations.get_cart_subtotal(cart)
+        # All totals in one aggregate query instead of one query each
+        totals = cart.items.aggregate(
+            subtotal=Sum('total_price'),
+            items_count=Count('id'),
+            quantity_total=Sum('quantity'),
+        )
+        subtotal = (totals['subtotal'] or Decimal('0.00')).quantize(Decimal('0.01'))
+        quantity_total = (totals['quantity_total'] or Decimal('0.00')).quantize(Decimal('0.001'))
         delivery_fee = cart.delivery_fee
         
+        items = cart.items.select_related(
+            'product_variant__product_template',
+            'product_variant__vendor',
+            'measurement_unit',
+        ).prefetch_related('selected_addons')
+        
         return {
-            'items_count': CartCalculations.get_cart_item_count(cart),
-            'quantity_total': float(CartCalculations.get_cart_quantity_total(cart)),
+            'items_count': totals['items_count'],
+            'quantity_total': float(quantity_total),
             'subtotal': float(subtotal),
             'delivery_fee': float(delivery_fee),
             'total': float(subtotal + delivery_fee),
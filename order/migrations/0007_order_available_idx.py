@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0006_order_driver_status_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(
+                condition=models.Q(('driver__isnull', True), ('status__in', ['confirmed', 'preparing', 'ready'])),
+                fields=['-created_at'],
+                name='order_available_idx',
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0007_order_available_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, max_length=128, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('idempotency_key__isnull', False)),
+                fields=('customer', 'idempotency_key'),
+                name='order_customer_idempotency_key_uniq',
+            ),
+        ),
+    ]
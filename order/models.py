@@ -57,6 +57,9 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=ORDER_STATUS, default='pending')
     cancellation_reason = models.TextField(blank=True)
     
+    # Client Idempotency-Key of the create request; a retried submit gets this order back
+    idempotency_key = models.CharField(max_length=128, null=True, blank=True, editable=False)
+    
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     confirmed_at = models.DateTimeField(null=True, blank=True)
@@ -70,6 +73,23 @@ class Order(models.Model):
     class Meta:
         db_table = 'order'
         ordering = ['-created_at']
+        indexes = [
+            # Driver dashboards filter a driver's orders by status
+            models.Index(fields=['driver', 'status']),
+            # available_orders: unassigned orders awaiting pickup, newest first
+            models.Index(
+                fields=['-created_at'],
+                name='order_available_idx',
+                condition=models.Q(driver__isnull=True, status__in=['confirmed', 'preparing', 'ready']),
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer', 'idempotency_key'],
+                condition=models.Q(idempotency_key__isnull=False),
+                name='order_customer_idempotency_key_uniq',
+            ),
+        ]
     
     def __str__(self):
         return f"Order #{self.order_number} - {self.customer.phone_number}"
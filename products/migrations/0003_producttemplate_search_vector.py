@@ -0,0 +1,38 @@
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """GIN index and backfill for product search; PostgreSQL only"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "UPDATE product_templates SET search_vector = "
+        "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(search_keywords, ''))"
+    )
+    schema_editor.execute(
+        "CREATE INDEX IF NOT EXISTS product_templates_search_vector_gin "
+        "ON product_templates USING gin (search_vector)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS product_templates_search_vector_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0002_favoriteitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producttemplate',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+def backfill_cached_pricing(apps, schema_editor):
+    ProductTemplate = apps.get_model('products', 'ProductTemplate')
+    UnitPrice = apps.get_model('products', 'UnitPrice')
+
+    for template_id in ProductTemplate.objects.values_list('id', flat=True).iterator():
+        top = UnitPrice.objects.filter(
+            product_variant__product_template_id=template_id,
+            product_variant__is_active=True,
+            product_variant__is_approved=True,
+            is_active=True
+        ).order_by('-selling_price').values_list('selling_price', 'unit__symbol').first()
+        if top:
+            ProductTemplate.objects.filter(pk=template_id).update(
+                cached_max_price=top[0],
+                cached_unit_symbol=top[1]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_producttemplate_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producttemplate',
+            name='cached_max_price',
+            field=models.DecimalField(decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='producttemplate',
+            name='cached_unit_symbol',
+            field=models.CharField(blank=True, editable=False, max_length=10),
+        ),
+        migrations.RunPython(backfill_cached_pricing, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,18 @@
 from decimal import Decimal
-from django.db import models
+from django.db import models, connection
+from django.db.models import Value
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.core.cache import cache
 from cloudinary.models import CloudinaryField
 import uuid
 
+
+# Short TTL like PRICING_CACHE_TTL, bounding how long a deactivated unit is
+# still accepted if a signal-driven delete is missed
+UNIT_CACHE_KEY = 'measurement_unit:{}'
+UNIT_CACHE_TTL = 60
+
 class GlobalSetting(models.Model):
     """Global settings that can be configured through admin"""
     key = models.CharField(max_length=100, unique=True)
@@ -132,6 +141,21 @@ class MeasurementUnit(models.Model):
     
     def __str__(self):
         return f"{self.name} ({self.symbol}) - {self.unit_type.name}"
+    
+    @classmethod
+    def get_active(cls, unit_id):
+        """
+        Active unit by id, served from the cache when possible.
+        Raises DoesNotExist like objects.get().
+        """
+        unit = cache.get_or_set(
+            UNIT_CACHE_KEY.format(unit_id),
+            lambda: cls.objects.select_related('unit_type').filter(id=unit_id, is_active=True).first(),
+            UNIT_CACHE_TTL
+        )
+        if unit is None:
+            raise cls.DoesNotExist(f'No active measurement unit {unit_id}')
+        return unit
 
 class ProductTemplate(models.Model):
     """Base product template - independent of vendors"""
@@ -179,6 +203,15 @@ class ProductTemplate(models.Model):
         help_text="Manually define similar products for AI recommendations"
     )
     
+    # Full-text search document over name and search_keywords (PostgreSQL only,
+    # GIN-indexed in migration 0003)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    # Denormalized highest active unit price across approved variants,
+    # kept current by products.signals
+    cached_max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, editable=False)
+    cached_unit_symbol = models.CharField(max_length=10, blank=True, editable=False)
+    
     # Metadata
     created_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -194,6 +227,36 @@ class ProductTemplate(models.Model):
     
     def __str__(self):
         return f"{self.name} - {self.category.name}"
+    
+    @classmethod
+    def refresh_cached_pricing(cls, template_id):
+        """Recompute cached_max_price/cached_unit_symbol for one template"""
+        top = UnitPrice.objects.filter(
+            product_variant__product_template_id=template_id,
+            product_variant__is_active=True,
+            product_variant__is_approved=True,
+            is_active=True
+        ).order_by('-selling_price').values_list('selling_price', 'unit__symbol').first()
+        price, symbol = top or (None, '')
+        cls.objects.filter(pk=template_id).update(
+            cached_max_price=price,
+            cached_unit_symbol=symbol
+        )
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if connection.vendor == 'postgresql' and (
+            update_fields is None or {'name', 'search_keywords'} & set(update_fields)
+        ):
+            # Built from the values being saved so it goes out in the same INSERT/UPDATE
+            self.search_vector = SearchVector(
+                Value(self.name), Value(self.search_keywords), config='simple'
+            )
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'search_vector'}
+        super().save(*args, **kwargs)
+
+
 class ProductVariant(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     product_template = models.ForeignKey(ProductTemplate, on_delete=models.CASCADE, related_name='variants')
@@ -0,0 +1,35 @@
+# products/pricing_cache.py
+"""
+Short-lived caches for listings that embed product pricing: the per-market
+products_with_pricing listing and each customer's favorites.
+
+Entries are keyed by a shared version so any catalog change can expire every
+listing at once without a key scan.
+"""
+import uuid
+
+from django.core.cache import cache
+
+
+PRICING_VERSION_CACHE_KEY = 'products_with_pricing:version'
+PRICING_CACHE_TTL = 60
+FAVORITES_CACHE_TTL = 300
+
+
+def _pricing_version():
+    return cache.get_or_set(PRICING_VERSION_CACHE_KEY, lambda: uuid.uuid4().hex, None)
+
+
+def pricing_cache_key(market_id):
+    """Cache key for a market's listing under the current version"""
+    return f'pwp:{_pricing_version()}:{market_id}'
+
+
+def favorites_cache_key(user_id):
+    """Cache key for a customer's favorites listing under the current version"""
+    return f'favorites:{_pricing_version()}:{user_id}'
+
+
+def bump_pricing_version():
+    """Expire all cached listings"""
+    cache.set(PRICING_VERSION_CACHE_KEY, uuid.uuid4().hex, None)
@@ -0,0 +1,57 @@
+# products/signals.py
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Category, FavoriteItem, MeasurementUnit, ProductTemplate, ProductVariant, UnitPrice, UNIT_CACHE_KEY
+from .pricing_cache import bump_pricing_version, favorites_cache_key
+
+
+@receiver([post_save, post_delete], sender=ProductTemplate)
+@receiver([post_save, post_delete], sender=ProductVariant)
+@receiver([post_save, post_delete], sender=UnitPrice)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=MeasurementUnit)
+def invalidate_product_pricing(sender, **kwargs):
+    """Expire cached product listings whenever catalog data changes"""
+    bump_pricing_version()
+
+
+@receiver([post_save, post_delete], sender=UnitPrice)
+def refresh_template_pricing_for_unit_price(sender, instance, **kwargs):
+    """Keep the template's cached display price in step with its unit prices"""
+    template_id = ProductVariant.objects.filter(
+        pk=instance.product_variant_id
+    ).values_list('product_template_id', flat=True).first()
+    if template_id:
+        ProductTemplate.refresh_cached_pricing(template_id)
+
+
+@receiver([post_save, post_delete], sender=ProductVariant)
+def refresh_template_pricing_for_variant(sender, instance, **kwargs):
+    """Variant activation/approval changes which prices count"""
+    ProductTemplate.refresh_cached_pricing(instance.product_template_id)
+
+
+@receiver(post_save, sender=MeasurementUnit)
+def refresh_template_pricing_for_unit(sender, instance, created, **kwargs):
+    """Templates priced in this unit carry a copy of its symbol"""
+    if created:
+        return
+    template_ids = UnitPrice.objects.filter(unit=instance).values_list(
+        'product_variant__product_template_id', flat=True
+    ).distinct()
+    for template_id in template_ids:
+        ProductTemplate.refresh_cached_pricing(template_id)
+
+
+@receiver([post_save, post_delete], sender=MeasurementUnit)
+def invalidate_cached_unit(sender, instance, **kwargs):
+    """Drop the cached copy used by MeasurementUnit.get_active"""
+    cache.delete(UNIT_CACHE_KEY.format(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=FavoriteItem)
+def invalidate_customer_favorites(sender, instance, **kwargs):
+    """Expire the customer's cached favorites listing"""
+    cache.delete(favorites_cache_key(instance.customer_id))
@@ -16,6 +16,9 @@ pip install pillow --no-cache-dir
 python manage.py collectstatic --no-input
 python manage.py migrate
 
+# Table backing the shared cache when REDIS_URL is not set
+python manage.py createcachetable
+
 
 python manage.py shell <<EOF
 from django.contrib.auth import get_user_model